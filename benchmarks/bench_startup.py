@@ -0,0 +1,167 @@
+"""Startup benchmark: how long a fresh process takes to import main and build HubspotEmployeeSync, and what it imports doing so.
+
+Every measurement runs in a new interpreter (nothing cached in sys.modules) against a throwaway config, medians over --runs:
+    python       bare interpreter start, the floor everything else sits on
+    import_main  `import main`
+    init         HubspotEmployeeSync() (config, tokens, the HubSpot client and its SDK)
+    deferred     importing what main leaves for first use (pandas, the Smartsheet SDK), paid by the first sync's Bamboo load
+                 while the HubSpot load is already on the network
+    startup      import_main + init, until the sync can start
+    total        startup + deferred
+plus the cold import cost of each heavy dependency and the biggest imports under `import main` (from -X importtime).
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --output startup.json
+    python benchmarks/bench_startup.py --baseline startup.json   # exits 1 on a regression or a deferred module imported eagerly
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from time import perf_counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+from bench_sync import write_config
+
+# imported on first use, none of them should be loaded once HubspotEmployeeSync() returns
+DEFERRED = ["pandas", "smartsheet"]
+STEPS = ("import_main", "init", "deferred", "startup", "total")
+DEPENDENCIES = DEFERRED + ["hubspot.crm.contacts", "cryptography.fernet", "requests", "numpy"]
+
+STARTUP_SCRIPT = """
+import sys, json, importlib
+from time import perf_counter
+start = perf_counter()
+import main
+imported = perf_counter()
+hbs = main.HubspotEmployeeSync()
+initialized = perf_counter()
+eager = [name for name in {deferred!r} if name in sys.modules]
+for name in {deferred!r}:
+    importlib.import_module(name)
+print(json.dumps({{"import_main": imported - start, "init": initialized - imported, "deferred": perf_counter() - initialized, "eager": eager}}))
+"""
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per measurement, the median is reported")
+    parser.add_argument("--top", type=int, default=10, help="imports under `import main` to list")
+    parser.add_argument("--output", help="write the results as JSON here")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs the baseline before it counts as a regression")
+    return parser.parse_args()
+
+#region ---- Measurements ----
+def run_python(workdir:str, *args) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    return subprocess.run([sys.executable, *args], cwd=workdir, env=env, capture_output=True, text=True, check=True)
+
+def time_process(workdir:str, code:str) -> float:
+    """Wall time of a whole interpreter running code"""
+    start = perf_counter()
+    run_python(workdir, "-c", code)
+    return perf_counter() - start
+
+def measure_startup(workdir:str) -> dict:
+    output = run_python(workdir, "-c", STARTUP_SCRIPT.format(deferred=DEFERRED)).stdout
+    return json.loads(output.strip().splitlines()[-1]) # the sync's logger also writes to stdout
+
+def dependency_costs(workdir:str, runs:int) -> dict:
+    """Cold import time per dependency (whole process minus a bare interpreter)"""
+    bare = statistics.median(time_process(workdir, "pass") for _ in range(runs))
+    return {name: max(0.0, statistics.median(time_process(workdir, f"import {name}") for _ in range(runs)) - bare) for name in DEPENDENCIES}
+
+def main_imports(workdir:str, top:int) -> dict:
+    """{module: cumulative seconds} for the biggest direct imports of main, from -X importtime"""
+    lines = run_python(workdir, "-X", "importtime", "-c", "import main").stderr.splitlines()
+    entries = [] # (depth, name, cumulative us) in the order imports finished
+    for line in lines:
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2 #one space after the bar, then two per level
+        entries.append((depth, name.strip(), int(cumulative)))
+    end = next(i for i, (depth, name, _) in enumerate(entries) if depth == 0 and name == "main")
+    children = []
+    for depth, name, cumulative in reversed(entries[:end]):
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append((name, cumulative / 1e6))
+    return dict(sorted(children, key=lambda item: item[1], reverse=True)[:top])
+#endregion
+
+#region ---- Report ----
+def collect(workdir:str, args) -> dict:
+    samples = [measure_startup(workdir) for _ in range(args.runs)]
+    for sample in samples:
+        sample["startup"] = sample["import_main"] + sample["init"]
+        sample["total"] = sample["startup"] + sample["deferred"]
+    return {
+        "python": statistics.median(time_process(workdir, "pass") for _ in range(args.runs)),
+        **{key: statistics.median(sample[key] for sample in samples) for key in STEPS},
+        "eager": sorted({name for sample in samples for name in sample["eager"]}),
+        "dependencies": dependency_costs(workdir, args.runs),
+        "main_imports": main_imports(workdir, args.top),
+    }
+
+def print_results(results:dict):
+    print("startup (median seconds)")
+    for key in ("python",) + STEPS:
+        print(f"  {key:<14}{results[key]:8.3f}")
+    print(f"  eager imports {', '.join(results['eager']) or 'none'}")
+    print("cold import per dependency")
+    for name, seconds in results["dependencies"].items():
+        print(f"  {name:<22}{seconds:8.3f}")
+    print("biggest imports under `import main` (cumulative)")
+    for name, seconds in results["main_imports"].items():
+        print(f"  {name:<30}{seconds:8.3f}")
+
+def compare(results:dict, baseline:dict, tolerance:float, floor:float = 0.02) -> list[str]:
+    """startup/total slower than baseline * (1 + tolerance), ignoring differences under `floor` seconds.
+    The steps in between aren't compared, deferring an import moves its cost from one to another"""
+    regressions = [f"{name} imported before first use" for name in results["eager"]]
+    for key in ("startup", "total"):
+        now, then = results[key], baseline.get(key)
+        if then is not None and now > then * (1 + tolerance) and now - then > floor:
+            regressions.append(f"{key} {then:.3f}s -> {now:.3f}s")
+    return regressions
+#endregion
+
+def main():
+    args = parse_args()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as inf:
+            baseline = json.load(inf)
+    output = os.path.abspath(args.output) if args.output else None
+
+    workdir = tempfile.mkdtemp(prefix="hub_sync_startup_")
+    cwd = os.getcwd()
+    try:
+        os.chdir(workdir)
+        config_args = argparse.Namespace(engine="python", state_store=False, config=[])
+        write_config(workdir, config_args, "http://127.0.0.1:9", "http://127.0.0.1:9") #never contacted, startup makes no requests
+        results = collect(workdir, args)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(results)
+    if output:
+        with open(output, "w") as of:
+            json.dump(results, of, indent=2)
+    failed = compare(results, baseline or {}, args.tolerance)
+    for line in failed:
+        print(f"REGRESSION {line}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
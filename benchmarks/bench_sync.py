@@ -0,0 +1,227 @@
+"""End-to-end benchmark of HubspotEmployeeSync.sync() against the local HubSpot/Smartsheet stand-ins.
+
+For each roster size: HubSpot and the log sheet are seeded as if the previous run synced a roster, the Bamboo
+sheet gets a churned copy of it, then the real sync runs (real SDKs over local HTTP) and the run's RunMetrics
+(per-phase wall time, API calls/bytes) is reported next to the stand-ins' request counts.
+
+    python benchmarks/bench_sync.py --employees 1000,10000 --churn 0.05
+    python benchmarks/bench_sync.py --employees 10000 --hubspot-latency 0.05 --hubspot-rate 100 --output bench.json
+    python benchmarks/bench_sync.py --employees 10000 --baseline bench.json   # exits 1 on a regression
+"""
+import os
+import io
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import contextlib
+from time import perf_counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+from fake_servers import FakeHubSpot, FakeSmartsheet
+from roster import BAMBOO_COLUMNS, REGIONS, generate_roster, churn
+
+BAMBOO_SHEET_ID = 1
+LOG_SHEET_ID = 2
+COMPANY_ID = "42"
+LOG_COLUMNS = ["Email", "First Name", "Last Name", "State", "Region", ("Latest Update", "TEXT_NUMBER"), "Comments", ("Removed", "CHECKBOX")]
+# export columns the sync doesn't read, so the column filtered fetch has something to skip
+EXTRA_BAMBOO_COLUMNS = [("jobTitle", "TEXT_NUMBER"), ("hireDate", "DATE"), ("supervisor", "TEXT_NUMBER")]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--employees", default="1000,10000", help="comma separated roster sizes (1k-500k)")
+    parser.add_argument("--churn", type=float, default=0.05, help="share of the roster hired/left/edited since the last sync")
+    parser.add_argument("--runs", type=int, default=1, help="syncs per size, runs after the first have no churn (steady state)")
+    parser.add_argument("--engine", choices=["python", "columnar"], default="python", help="diff_engine config")
+    parser.add_argument("--state-store", action="store_true", help="use a state store, runs after the first are incremental")
+    parser.add_argument("--hubspot-latency", type=float, default=0.0, help="seconds added to every HubSpot request")
+    parser.add_argument("--smartsheet-latency", type=float, default=0.0, help="seconds added to every Smartsheet request")
+    parser.add_argument("--hubspot-page-size", type=int, default=100, help="most results per HubSpot search page")
+    parser.add_argument("--hubspot-rate", type=int, default=None, help="HubSpot requests per 10s before 429s (default unlimited)")
+    parser.add_argument("--smartsheet-rate", type=int, default=None, help="Smartsheet requests per minute before 429s (default unlimited)")
+    parser.add_argument("--config", action="append", default=[], metavar="KEY=JSON", help="extra sync config, e.g. --config hubspot_search_partitions=4")
+    parser.add_argument("--output", help="write the results as JSON here")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs the baseline before it counts as a regression")
+    parser.add_argument("--verbose", action="store_true", help="show the sync's own log output")
+    parser.add_argument("--keep", action="store_true", help="keep the working directory")
+    return parser.parse_args()
+
+#region ---- Setup ----
+def write_config(workdir:str, args, hubspot_url:str, smartsheet_url:str):
+    """configs/config.json for the sync, pointed at the stand-ins, with tokens stored the way crypter expects"""
+    config = {
+        "bamboo_data_ss_id": BAMBOO_SHEET_ID,
+        "hubspot_ss_id": LOG_SHEET_ID,
+        "HB_DB_COMPANY_ID": COMPANY_ID,
+        "regions": REGIONS,
+        "hubspot_host": hubspot_url,
+        "smartsheet_api_base": f"{smartsheet_url}/2.0",
+        "diff_engine": args.engine,
+        # the client side limits default to production's, let the stand-ins' budgets decide instead
+        "hubspot_search_rate_limit": 1000,
+        "hubspot_rate_limit": 10000,
+        "smartsheet_rate_limit": 100000,
+    }
+    if args.state_store:
+        config["state_store_path"] = "configs/sync_state.db"
+    for item in args.config:
+        key, _, value = item.partition("=")
+        config[key] = json.loads(value)
+    os.makedirs(os.path.join(workdir, "configs"), exist_ok=True)
+    path = os.path.join(workdir, "configs", "config.json")
+    with open(path, "w") as of:
+        json.dump(config, of, indent=2)
+    import configs.crypter as crypter
+    crypter.encrypt_to_config("bench-hubspot-token", "hubspot_token", file_path=path)
+    crypter.encrypt_to_config("bench-smartsheet-token", "ss_automation_token", file_path=path)
+
+def hubspot_contact(row:dict, mapper) -> dict:
+    """Bamboo row -> HubSpot contact properties, as a previous sync would have written them"""
+    return {
+        "email": row["emailAsText"],
+        "firstname": row["preferredName"] or row["firstName"],
+        "lastname": row["lastName"],
+        "state": row["location"],
+        "dowbuilt_region": mapper.map(row["location"], row["division"]),
+        "marketing_classification": "Dowbuilt Employee",
+        "associatedcompanyid": COMPANY_ID,
+    }
+
+def seed(hubspot:FakeHubSpot, smartsheet:FakeSmartsheet, size:int, rate:float):
+    """Previous state = a synced roster of `size`, Bamboo now = that roster churned by `rate`"""
+    from configs.region_mapper import RegionMapper
+    mapper = RegionMapper(REGIONS)
+    synced = generate_roster(size)
+    current = churn(synced, rate)
+    hubspot.load(hubspot_contact(row, mapper) for row in synced)
+    extra = [None] * len(EXTRA_BAMBOO_COLUMNS)
+    smartsheet.add_sheet(BAMBOO_SHEET_ID, "Employees_Bamboo", BAMBOO_COLUMNS + EXTRA_BAMBOO_COLUMNS,
+                         [[row[column] for column in BAMBOO_COLUMNS] + extra for row in current])
+    smartsheet.add_sheet(LOG_SHEET_ID, "HubSpot Employee Log", LOG_COLUMNS, [
+        [contact["email"], contact["firstname"], contact["lastname"], contact["state"], contact["dowbuilt_region"], "2020-01-01 00:00", "Initial Sync", False]
+        for contact in (hubspot_contact(row, mapper) for row in synced)
+    ])
+    return {row["emailAsText"] for row in current}
+
+def reset_workdir(workdir:str):
+    """Drops the sheet cache and state store so each size starts cold"""
+    shutil.rmtree(os.path.join(workdir, "configs", "cache"), ignore_errors=True)
+    for name in ("sync_state.db",):
+        path = os.path.join(workdir, "configs", name)
+        if os.path.exists(path):
+            os.remove(path)
+#endregion
+
+#region ---- Run ----
+def run_sync(sync_module, verbose:bool):
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        start = perf_counter()
+        hbs = sync_module.HubspotEmployeeSync()
+        hbs.sync()
+        elapsed = perf_counter() - start
+    return hbs, elapsed
+
+def bench_size(sync_module, hubspot, smartsheet, workdir, size, args) -> list[dict]:
+    reset_workdir(workdir)
+    expected = seed(hubspot, smartsheet, size, args.churn)
+    results = []
+    for run in range(args.runs):
+        hubspot.requests.clear(); smartsheet.requests.clear()
+        hubspot.throttled = smartsheet.throttled = 0
+        hbs, elapsed = run_sync(sync_module, args.verbose)
+        synced = {properties.get("email") for properties in hubspot.contacts.values()}
+        metrics = hbs.metrics.as_dict()
+        results.append({
+            "employees": size,
+            "run": run + 1,
+            "seconds": round(elapsed, 3),
+            "phases": metrics["phases"],
+            "counts": metrics["counts"],
+            "api_calls": metrics["api_calls"],
+            "api_bytes": metrics["api_bytes"],
+            "server_requests": {"hubspot": dict(hubspot.requests), "smartsheet": dict(smartsheet.requests)},
+            "throttled": {"hubspot": hubspot.throttled, "smartsheet": smartsheet.throttled},
+            "in_sync": synced == expected,
+        })
+    return results
+
+def print_results(results:list[dict]):
+    phase_names = list(dict.fromkeys(name for result in results for name in result["phases"]))
+    header = ["employees", "run", "total"] + phase_names + ["hs calls", "ss calls", "429s", "in sync"]
+    rows = [[
+        str(result["employees"]), str(result["run"]), f"{result['seconds']:.2f}",
+        *(f"{result['phases'].get(name, 0):.2f}" for name in phase_names),
+        str(result["api_calls"].get("hubspot", 0)), str(result["api_calls"].get("smartsheet", 0)),
+        str(sum(result["throttled"].values())), "yes" if result["in_sync"] else "NO",
+    ] for result in results]
+    widths = [max(len(cell) for cell in column) for column in zip(header, *rows)]
+    for row in [header] + rows:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+def compare(results:list[dict], baseline:list[dict], tolerance:float, floor:float = 0.05) -> list[str]:
+    """Phases (and totals) slower than baseline * (1 + tolerance), ignoring differences under `floor` seconds"""
+    previous = {(result["employees"], result["run"]): result for result in baseline}
+    regressions = []
+    for result in results:
+        base = previous.get((result["employees"], result["run"]))
+        if base is None:
+            continue
+        timings = [("total", result["seconds"], base["seconds"])]
+        timings += [(name, seconds, base["phases"].get(name)) for name, seconds in result["phases"].items()]
+        for name, now, then in timings:
+            if then is not None and now > then * (1 + tolerance) and now - then > floor:
+                regressions.append(f"{result['employees']} employees run {result['run']}: {name} {then:.2f}s -> {now:.2f}s")
+        for service, calls in result["api_calls"].items():
+            if calls > base["api_calls"].get(service, calls):
+                regressions.append(f"{result['employees']} employees run {result['run']}: {service} calls {base['api_calls'][service]} -> {calls}")
+    return regressions
+#endregion
+
+def main():
+    args = parse_args()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as inf:
+            baseline = json.load(inf)
+    output = os.path.abspath(args.output) if args.output else None
+
+    hubspot = FakeHubSpot(page_size=args.hubspot_page_size, latency=args.hubspot_latency, rate=args.hubspot_rate, per=10)
+    smartsheet = FakeSmartsheet(latency=args.smartsheet_latency, rate=args.smartsheet_rate, per=60)
+    workdir = tempfile.mkdtemp(prefix="hub_sync_bench_")
+    cwd = os.getcwd()
+    results = []
+    try:
+        hubspot_url, smartsheet_url = hubspot.start(), smartsheet.start()
+        os.chdir(workdir) #the sync reads configs/config.json relative to the working directory
+        write_config(workdir, args, hubspot_url, smartsheet_url)
+        import main as sync_module
+        for size in (int(value) for value in args.employees.split(",")):
+            results.extend(bench_size(sync_module, hubspot, smartsheet, workdir, size, args))
+    finally:
+        os.chdir(cwd)
+        hubspot.stop(); smartsheet.stop()
+        if args.keep:
+            print(f"working directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(results)
+    if output:
+        with open(output, "w") as of:
+            json.dump(results, of, indent=2)
+    failed = [f"{result['employees']} employees run {result['run']}: HubSpot doesn't match Bamboo after the sync" for result in results if not result["in_sync"]]
+    if baseline is not None:
+        failed += compare(results, baseline, args.tolerance)
+    for line in failed:
+        print(f"REGRESSION {line}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
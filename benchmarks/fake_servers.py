@@ -0,0 +1,406 @@
+"""In-process stand-ins for the HubSpot CRM and Smartsheet REST APIs, served over local HTTP so the real SDKs,
+retries and tracing hooks run unchanged. Only the endpoints hub_sync uses are implemented."""
+import re
+import json
+import time
+import random
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+class FakeServer(ABC):
+    """Threaded local HTTP server with per-request latency, a request budget that answers 429 when exceeded,
+    and request counts per route.
+    Params:
+        latency: seconds added to every request (plus up to `jitter` random seconds)
+        rate: requests allowed per `per` seconds before answering 429, None never throttles"""
+    routes = () #(method, compiled path regex, handler method name)
+
+    def __init__(self, latency:float = 0.0, jitter:float = 0.0, rate:int = None, per:float = 10.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate = rate
+        self.per = per
+        self.lock = threading.RLock()
+        self.requests = Counter()
+        self.throttled = 0
+        self._window = []
+        self.httpd = None
+
+    #region ---- Server ----
+    def start(self) -> str:
+        """Starts serving on a free local port. Returns: base url"""
+        fake = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True #headers and body go out in separate writes, don't wait on delayed acks
+            def log_message(self, *args):
+                pass
+            def _dispatch(self):
+                fake._handle(self)
+            do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+
+    def _handle(self, handler):
+        url = urlsplit(handler.path)
+        length = int(handler.headers.get("Content-Length") or 0)
+        raw = handler.rfile.read(length) if length else b""
+        body = json.loads(raw) if raw else None
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.random() * self.jitter)
+        for method, pattern, name in self.routes:
+            match = pattern.fullmatch(url.path)
+            if method == handler.command and match:
+                with self.lock:
+                    self.requests[name] += 1
+                wait = self._take_token()
+                if wait is not None:
+                    status, payload, headers = self.throttled_response(wait)
+                else:
+                    status, payload, headers = getattr(self, name)(*match.groups(), query=query, body=body)
+                break
+        else:
+            status, payload, headers = 404, {"message": f"no fake route for {handler.command} {url.path}"}, {}
+        data = b"" if payload is None else json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            handler.send_header(name, str(value))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _take_token(self):
+        """Sliding window request budget. Returns: seconds until the next request is allowed, None if this one is"""
+        if self.rate is None:
+            return None
+        with self.lock:
+            now = time.monotonic()
+            self._window = [stamp for stamp in self._window if now - stamp < self.per]
+            if len(self._window) >= self.rate:
+                self.throttled += 1
+                return self.per - (now - self._window[0])
+            self._window.append(now)
+            return None
+
+    @abstractmethod
+    def throttled_response(self, wait:float):
+        """(status, body, headers) for a request over the budget, in the service's own 429 format"""
+    #endregion
+
+class FakeHubSpot(FakeServer):
+    """CRM v3 contacts: search (filters, sorts, after paging, 10k result ceiling) and batch create/upsert/archive.
+    Params:
+        page_size: most results one search page returns, whatever limit the request asks for"""
+    routes = (
+        ("POST", re.compile(r"/crm/v3/objects/contacts/search"), "search"),
+        ("POST", re.compile(r"/crm/v3/objects/contacts/batch/create"), "batch_create"),
+        ("POST", re.compile(r"/crm/v3/objects/contacts/batch/upsert"), "batch_upsert"),
+        ("POST", re.compile(r"/crm/v3/objects/contacts/batch/archive"), "batch_archive"),
+    )
+    SEARCH_CEILING = 10000
+
+    def __init__(self, page_size:int = 100, **kwargs):
+        super().__init__(**kwargs)
+        self.page_size = page_size
+        self.contacts = {} #id -> properties
+        self.ids = [] #sorted ids, for keyset (hs_object_id) searches
+        self.by_email = {}
+        self.next_id = 1000
+
+    def load(self, contacts:list[dict]):
+        """Replaces the contact store with `contacts` (property dicts), ids are assigned in order"""
+        with self.lock:
+            self.contacts, self.ids, self.by_email = {}, [], {}
+            for properties in contacts:
+                self._insert(dict(properties))
+
+    def _insert(self, properties:dict) -> int:
+        self.next_id += 1
+        contact_id = self.next_id
+        properties["hs_object_id"] = str(contact_id)
+        properties.setdefault("createdate", _now())
+        properties["lastmodifieddate"] = _now()
+        self.contacts[contact_id] = properties
+        self.ids.append(contact_id) #ids only grow, so the list stays sorted
+        if properties.get("email"):
+            self.by_email[properties["email"].lower()] = contact_id
+        return contact_id
+
+    def _object(self, contact_id:int, properties:list = None) -> dict:
+        stored = self.contacts[contact_id]
+        shown = stored if properties is None else {name: stored.get(name) for name in list(properties) + ["hs_object_id", "createdate", "lastmodifieddate"]}
+        return {"id": str(contact_id), "properties": shown, "createdAt": stored["createdate"], "updatedAt": stored["lastmodifieddate"], "archived": False}
+
+    def throttled_response(self, wait):
+        return 429, {"status": "error", "message": "You have reached your ten_secondly_rolling limit.", "category": "RATE_LIMITS"}, {
+            "Retry-After": f"{wait:.2f}", "X-HubSpot-RateLimit-Max": self.rate, "X-HubSpot-RateLimit-Remaining": 0,
+        }
+
+    def _matches(self, properties:dict, filters:list) -> bool:
+        for rule in filters:
+            name, operator, value = rule.get("propertyName"), rule.get("operator"), rule.get("value")
+            actual = properties.get(name)
+            if name == "hs_object_id":
+                actual, value = int(actual), int(value) if value is not None else None
+            elif isinstance(actual, str) and isinstance(value, str):
+                actual, value = actual.lower(), value.lower()
+            if operator == "EQ" and actual != value: return False
+            if operator == "NEQ" and actual == value: return False
+            if operator == "GT" and not (actual is not None and actual > value): return False
+            if operator == "GTE" and not (actual is not None and actual >= value): return False
+            if operator == "LT" and not (actual is not None and actual < value): return False
+            if operator == "LTE" and not (actual is not None and actual <= value): return False
+            if operator == "CONTAINS_TOKEN" and not (isinstance(actual, str) and value.strip("*") in actual): return False
+            if operator == "HAS_PROPERTY" and actual in (None, ""): return False
+        return True
+
+    def search(self, query, body):
+        body = body or {}
+        groups = [group.get("filters", []) for group in body.get("filterGroups") or []] or [[]]
+        sorts = body.get("sorts") or []
+        descending = bool(sorts) and sorts[0].get("direction") == "DESCENDING"
+        offset = int(body.get("after") or 0)
+        limit = min(int(body.get("limit") or 10), self.page_size)
+        if offset + limit > self.SEARCH_CEILING:
+            return 400, {"status": "error", "message": f"Search results are limited to {self.SEARCH_CEILING}", "category": "VALIDATION_ERROR"}, {}
+        with self.lock:
+            ids = self.ids
+            # keyset searches carry an hs_object_id lower bound in every group, start the scan there
+            bounds = [int(rule["value"]) for rule in groups[0] if rule.get("propertyName") == "hs_object_id" and rule.get("operator") == "GT"]
+            start = bisect.bisect_right(ids, max(bounds)) if bounds and not descending else 0
+            candidates = reversed(ids) if descending else ids[start:]
+            found, skipped = [], 0
+            for contact_id in candidates:
+                if contact_id not in self.contacts:
+                    continue
+                if any(self._matches(self.contacts[contact_id], filters) for filters in groups):
+                    if skipped < offset:
+                        skipped += 1
+                        continue
+                    found.append(contact_id)
+                    if len(found) > limit: #one extra tells us there's a next page
+                        break
+            page = found[:limit]
+            response = {
+                "total": len(ids) - start, #upper bound, counting exactly would scan every contact per page
+                "results": [self._object(contact_id, body.get("properties")) for contact_id in page],
+            }
+        if len(found) > limit:
+            response["paging"] = {"next": {"after": str(offset + limit)}}
+        return 200, response, {"X-HubSpot-RateLimit-Secondly-Remaining": 10}
+
+    def batch_create(self, query, body):
+        started = _now()
+        with self.lock:
+            results = [self._object(self._insert(dict(item.get("properties") or {}))) for item in body.get("inputs", [])]
+        return 201, {"status": "COMPLETE", "results": results, "startedAt": started, "completedAt": _now()}, {}
+
+    def batch_upsert(self, query, body):
+        started = _now()
+        results = []
+        with self.lock:
+            for item in body.get("inputs", []):
+                contact_id = self.by_email.get(str(item.get("id")).lower())
+                new = contact_id is None
+                if new:
+                    contact_id = self._insert({"email": item.get("id"), **(item.get("properties") or {})})
+                else:
+                    self.contacts[contact_id].update(item.get("properties") or {})
+                    self.contacts[contact_id]["lastmodifieddate"] = _now()
+                results.append({**self._object(contact_id), "new": new})
+        return 200, {"status": "COMPLETE", "results": results, "startedAt": started, "completedAt": _now()}, {}
+
+    def batch_archive(self, query, body):
+        with self.lock:
+            for item in body.get("inputs", []):
+                properties = self.contacts.pop(int(item["id"]), None)
+                if properties and properties.get("email"):
+                    self.by_email.pop(properties["email"].lower(), None)
+        return 204, None, {}
+
+class FakeSmartsheet(FakeServer):
+    """Smartsheet 2.0 sheets: get sheet (paging, column filter, rowsModifiedSince), version, columns,
+    add/update rows (partial success), delete rows and move rows.
+    Default budget is Smartsheet's 300 requests per minute."""
+    routes = (
+        ("GET", re.compile(r"/2\.0/sheets/(\d+)"), "get_sheet"),
+        ("GET", re.compile(r"/2\.0/sheets/(\d+)/version"), "get_version"),
+        ("GET", re.compile(r"/2\.0/sheets/(\d+)/columns"), "get_columns"),
+        ("POST", re.compile(r"/2\.0/sheets/(\d+)/rows"), "add_rows"),
+        ("PUT", re.compile(r"/2\.0/sheets/(\d+)/rows"), "update_rows"),
+        ("DELETE", re.compile(r"/2\.0/sheets/(\d+)/rows"), "delete_rows"),
+        ("POST", re.compile(r"/2\.0/sheets/(\d+)/rows/move"), "move_rows"),
+    )
+
+    def __init__(self, rate:int = 300, per:float = 60.0, **kwargs):
+        super().__init__(rate=rate, per=per, **kwargs)
+        self.sheets = {}
+        self.next_id = 5000
+
+    def add_sheet(self, sheet_id:int, name:str, columns:list, rows:list = ()):
+        """Creates (or replaces) a sheet.
+        Params:
+            columns: list of titles or (title, type) pairs, the first column is primary
+            rows: lists of cell values in column order"""
+        columns = [(column, "TEXT_NUMBER") if isinstance(column, str) else tuple(column) for column in columns]
+        with self.lock:
+            self.sheets[sheet_id] = {
+                "name": name,
+                "version": 1,
+                "columns": [{"id": sheet_id * 100 + i, "index": i, "title": title, "type": column_type, "primary": i == 0}
+                            for i, (title, column_type) in enumerate(columns)],
+                "rows": {},
+            }
+            for values in rows:
+                self._new_row(sheet_id, dict(zip((column["id"] for column in self.sheets[sheet_id]["columns"]), values)))
+
+    def rows_as_dicts(self, sheet_id:int) -> list[dict]:
+        """The sheet's rows as {title: value} (for checking results)"""
+        sheet = self.sheets[sheet_id]
+        titles = {column["id"]: column["title"] for column in sheet["columns"]}
+        return [{titles[column_id]: value for column_id, value in row["cells"].items()} for row in sheet["rows"].values()]
+
+    def _new_row(self, sheet_id:int, cells:dict) -> int:
+        self.next_id += 1
+        self.sheets[sheet_id]["rows"][self.next_id] = {"cells": cells, "modified": time.time()}
+        return self.next_id
+
+    def _row(self, sheet:dict, row_id:int, column_ids=None) -> dict:
+        row = sheet["rows"][row_id]
+        cells = []
+        for column in sheet["columns"]:
+            if column_ids and column["id"] not in column_ids:
+                continue
+            value = row["cells"].get(column["id"])
+            cell = {"columnId": column["id"]}
+            if value not in (None, ""):
+                cell["value"] = value
+                cell["displayValue"] = str(value) if not isinstance(value, bool) else None
+            cells.append(cell)
+        modified = datetime.fromtimestamp(row["modified"], timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+        return {"id": row_id, "modifiedAt": modified, "cells": cells}
+
+    def _error(self, status:int, code:int, message:str):
+        return status, {"errorCode": code, "message": message, "refId": "fake"}, {}
+
+    def throttled_response(self, wait):
+        return 429, {"errorCode": 4003, "message": "Rate limit exceeded.", "refId": "fake"}, {"Retry-After": f"{wait:.2f}"}
+
+    def _write_result(self, sheet:dict, result:list, failed:list = ()):
+        sheet["version"] += 1
+        payload = {"message": "PARTIAL_SUCCESS" if failed else "SUCCESS", "resultCode": 3 if failed else 0, "version": sheet["version"], "result": result}
+        if failed:
+            payload["failedItems"] = list(failed)
+        return 200, payload, {}
+
+    def get_sheet(self, sheet_id, query, body):
+        sheet = self.sheets.get(int(sheet_id))
+        if sheet is None:
+            return self._error(404, 1006, "Not Found")
+        with self.lock:
+            column_ids = {int(value) for value in query["columnIds"].split(",")} if query.get("columnIds") else None
+            row_ids = list(sheet["rows"])
+            if query.get("rowsModifiedSince"):
+                since = datetime.fromisoformat(query["rowsModifiedSince"].replace("Z", "+00:00")).timestamp()
+                row_ids = [row_id for row_id in row_ids if sheet["rows"][row_id]["modified"] >= since]
+            total = len(row_ids)
+            if query.get("pageSize"):
+                size, page = int(query["pageSize"]), int(query.get("page") or 1)
+                row_ids = row_ids[(page - 1) * size:page * size]
+            return 200, {
+                "id": int(sheet_id),
+                "name": sheet["name"],
+                "version": sheet["version"],
+                "permalink": f"https://app.smartsheet.com/sheets/{sheet_id}",
+                "totalRowCount": total,
+                "columns": [column for column in sheet["columns"] if not column_ids or column["id"] in column_ids],
+                "rows": [self._row(sheet, row_id, column_ids) for row_id in row_ids],
+            }, {}
+
+    def get_version(self, sheet_id, query, body):
+        sheet = self.sheets.get(int(sheet_id))
+        if sheet is None:
+            return self._error(404, 1006, "Not Found")
+        return 200, {"version": sheet["version"]}, {}
+
+    def get_columns(self, sheet_id, query, body):
+        sheet = self.sheets.get(int(sheet_id))
+        if sheet is None:
+            return self._error(404, 1006, "Not Found")
+        columns = sheet["columns"]
+        return 200, {"pageNumber": 1, "pageSize": len(columns), "totalPages": 1, "totalCount": len(columns), "data": columns}, {}
+
+    def add_rows(self, sheet_id, query, body):
+        sheet = self.sheets.get(int(sheet_id))
+        if sheet is None:
+            return self._error(404, 1006, "Not Found")
+        with self.lock:
+            rows = body if isinstance(body, list) else [body]
+            new_ids = [self._new_row(int(sheet_id), {cell["columnId"]: cell.get("value") for cell in row.get("cells", [])}) for row in rows]
+            return self._write_result(sheet, [self._row(sheet, row_id) for row_id in new_ids])
+
+    def update_rows(self, sheet_id, query, body):
+        sheet = self.sheets.get(int(sheet_id))
+        if sheet is None:
+            return self._error(404, 1006, "Not Found")
+        partial = query.get("allowPartialSuccess") == "true"
+        with self.lock:
+            rows = body if isinstance(body, list) else [body]
+            missing = [i for i, row in enumerate(rows) if row.get("id") not in sheet["rows"]]
+            if missing and not partial:
+                return self._error(404, 1006, "Not Found")
+            result, failed = [], []
+            for i, row in enumerate(rows):
+                if i in missing:
+                    failed.append({"index": i, "rowId": row.get("id"), "error": {"errorCode": 1006, "message": "Not Found"}})
+                    continue
+                stored = sheet["rows"][row["id"]]
+                stored["cells"].update({cell["columnId"]: cell.get("value") for cell in row.get("cells", [])})
+                stored["modified"] = time.time()
+                result.append(self._row(sheet, row["id"]))
+            return self._write_result(sheet, result, failed)
+
+    def delete_rows(self, sheet_id, query, body):
+        sheet = self.sheets.get(int(sheet_id))
+        if sheet is None:
+            return self._error(404, 1006, "Not Found")
+        with self.lock:
+            ids = [int(value) for value in (query.get("ids") or "").split(",") if value]
+            if query.get("ignoreRowsNotFound") != "true" and any(row_id not in sheet["rows"] for row_id in ids):
+                return self._error(404, 1006, "Not Found")
+            deleted = [row_id for row_id in ids if sheet["rows"].pop(row_id, None) is not None]
+            return self._write_result(sheet, deleted)
+
+    def move_rows(self, sheet_id, query, body):
+        source, target = self.sheets.get(int(sheet_id)), self.sheets.get(int(body["to"]["sheetId"]))
+        if source is None or target is None:
+            return self._error(404, 1006, "Not Found")
+        with self.lock:
+            by_title = {column["title"]: column["id"] for column in target["columns"]}
+            titles = {column["id"]: column["title"] for column in source["columns"]}
+            moved = []
+            for row_id in body.get("rowIds", []):
+                row = source["rows"].pop(row_id, None)
+                if row is not None:
+                    cells = {by_title[titles[column_id]]: value for column_id, value in row["cells"].items() if titles[column_id] in by_title}
+                    moved.append({"from": row_id, "to": self._new_row(int(body["to"]["sheetId"]), cells)})
+            source["version"] += 1
+            target["version"] += 1
+            return 200, {"destinationSheetId": int(body["to"]["sheetId"]), "rowMappings": moved}, {}
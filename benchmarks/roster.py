@@ -0,0 +1,46 @@
+"""Synthetic Bamboo rosters for the benchmarks: a reproducible roster of n employees plus a churned copy
+(hires, departures, edits) to sync it against."""
+import random
+
+BAMBOO_COLUMNS = ["preferredName", "firstName", "lastName", "emailAsText", "location", "division"]
+FIRST_NAMES = ["Ana", "Ben", "Cara", "Dev", "Eli", "Fay", "Gus", "Hana", "Ivan", "Jo", "Kai", "Lena", "Max", "Nia", "Omar", "Pia"]
+LAST_NAMES = ["Nguyen", "Smith", "Garcia", "Chen", "Patel", "Olsen", "Kim", "Lopez", "Brown", "Ito", "Moreau", "Silva"]
+# region -> Bamboo divisions/locations mapped to it, also written to the benchmark config's `regions`
+REGIONS = {
+    "Northwest": ["Seattle", "Portland", "Division 1"],
+    "Mountain": ["Boise", "Denver", "Division 2"],
+    "California": ["San Francisco", "Los Angeles", "Division 3"],
+}
+LOCATIONS = ["Seattle", "Portland", "Boise", "Denver", "San Francisco", "Los Angeles"]
+DIVISIONS = ["Division 1", "Division 2", "Division 3", "Division 10"]
+
+def _employee(rng:random.Random, number:int) -> dict:
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    return {
+        "preferredName": first if rng.random() < 0.2 else None,
+        "firstName": first,
+        "lastName": last,
+        "emailAsText": f"{first}.{last}.{number}@dowbuilt.com".lower(),
+        "location": rng.choice(LOCATIONS),
+        "division": rng.choice(DIVISIONS),
+    }
+
+def generate_roster(size:int, seed:int = 0) -> list[dict]:
+    """size Bamboo export rows ({column: value}), same seed -> same roster"""
+    rng = random.Random(seed)
+    return [_employee(rng, number) for number in range(size)]
+
+def churn(roster:list[dict], rate:float, seed:int = 1) -> list[dict]:
+    """Copy of roster where `rate` of the employees changed: a third each left, were hired or had an edit
+    (last name, location or division)"""
+    rng = random.Random(seed)
+    changes = int(len(roster) * rate)
+    leavers, hires, edits = changes // 3, changes // 3, changes - 2 * (changes // 3)
+    result = [dict(row) for row in roster]
+    for i in sorted(rng.sample(range(len(result)), leavers), reverse=True):
+        result.pop(i)
+    for i in rng.sample(range(len(result)), min(edits, len(result))):
+        field = rng.choice(["lastName", "location", "division"])
+        result[i][field] = rng.choice(LAST_NAMES if field == "lastName" else LOCATIONS if field == "location" else DIVISIONS)
+    result.extend(_employee(rng, len(roster) + number) for number in range(hires))
+    return result
@@ -0,0 +1,111 @@
+#region ---- Imports ----
+import time
+import threading
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+# Local imports
+from configs.setup_logger import setup_logger
+#endregion
+
+def http_retry_after(error:Exception, attempt:int):
+    """Default throttle check for SDK exceptions that expose `status` and `headers` (HubSpot ApiException).
+    Returns:
+        seconds to wait before retrying, or None if the error is not a 429"""
+    if getattr(error, "status", None) != 429:
+        return None
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return min(2 ** attempt, 60) # no usable header, exponential backoff
+
+
+class TokenBucket():
+    """Thread-safe token bucket allowing `rate` calls every `per` seconds.
+    HubSpot limits are per rolling 10 second window, so the bucket starts full and refills continuously."""
+    def __init__(self, rate:int, per:float):
+        self.capacity = rate
+        self.tokens = float(rate)
+        self.fill_rate = rate / per
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available (and any 429 pause has expired)"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.fill_rate)
+            time.sleep(wait)
+
+    def pause(self, seconds:float):
+        """Stops every caller from acquiring for `seconds` (used on 429 responses)"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+@dataclass
+class ChunkResult:
+    """Outcome of a single chunk sent through the BatchExecutor"""
+    chunk:list
+    response:object = None
+    error:Exception = None
+    attempts:int = 1
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class BatchExecutor():
+    """Sends chunks concurrently under a concurrency cap and a shared token bucket.
+    Throttled chunks are retried after the server's Retry-After, everything else in `errors` is
+    captured on the ChunkResult. Results come back in the order the chunks were submitted.
+    The cap covers every run() on the executor, so concurrent runs (create/update/delete) share max_workers requests in flight."""
+    def __init__(self, max_workers:int = 4, rate:int = 100, per:float = 10, max_retries:int = 5,
+                 retry_after = http_retry_after, errors:tuple = (Exception,)):
+        self.log = setup_logger(__name__)
+        self.max_workers = max(1, max_workers)
+        self.in_flight = threading.BoundedSemaphore(self.max_workers)
+        self.bucket = TokenBucket(rate, per)
+        self.max_retries = max_retries
+        self.retry_after = retry_after
+        self.errors = errors
+
+    def run(self, chunks, send) -> list[ChunkResult]:
+        """Calls send(chunk) for every chunk.
+        Params:
+            chunks: iterable of chunks (lists)
+            send: callable taking one chunk and returning the API response
+        Returns:
+            list of ChunkResult in submission order"""
+        chunks = list(chunks)
+        if not chunks:
+            return []
+        workers = min(self.max_workers, len(chunks))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(self._send, chunk, send) for chunk in chunks]
+            return [future.result() for future in futures]
+
+    def _send(self, chunk, send) -> ChunkResult:
+        attempt = 0
+        while True:
+            attempt += 1
+            self.bucket.acquire()
+            try:
+                with self.in_flight:
+                    response = send(chunk)
+                return ChunkResult(chunk, response=response, attempts=attempt)
+            except self.errors as e:
+                wait = self.retry_after(e, attempt)
+                if wait is None or attempt > self.max_retries:
+                    return ChunkResult(chunk, error=e, attempts=attempt)
+                self.log.warning(f"Throttled on attempt {attempt}, retrying chunk of {len(chunk)} in {wait:.1f}s")
+                self.bucket.pause(wait)
@@ -0,0 +1,67 @@
+"""Process-wide SDK clients. Every grid and HubspotClient in the process gets its client from here, so
+credentials are decrypted once and HTTP connections (and their TLS sessions) are kept alive and reused
+across grids, phases and syncs instead of every object opening its own pool."""
+import threading
+from functools import lru_cache
+import configs.crypter as crypter
+
+_lock = threading.Lock()
+_smartsheet_clients = {} #(api_base, pool_size) -> Smartsheet
+_hubspot_clients = {} #(host, pool_size) -> hubspot.Client
+
+@lru_cache(maxsize=None)
+def credential(name:str) -> str:
+    """Decrypted token from configs/config.json, decrypted once per process"""
+    return crypter.decrypt_from_config(name)
+
+def smartsheet_client(api_base:str = "https://api.smartsheet.com/2.0", pool_size:int = 8, on_response=None):
+    """The shared Smartsheet client for api_base, one requests session (keep-alive pool of pool_size) for every grid.
+    Params:
+        on_response: requests response hook added when the client is created (grid's metrics hook)"""
+    key = (api_base, pool_size)
+    with _lock:
+        client = _smartsheet_clients.get(key)
+        if client is None:
+            import smartsheet #SDKs are imported when the first client is built, not when this module is
+            client = smartsheet.Smartsheet(access_token=credential("ss_automation_token"), api_base=api_base, max_connections=pool_size)
+            client.errors_as_exceptions(True)
+            if on_response is not None:
+                hooks = client._session.hooks # the SDK installs its own response hook as a bare function, not a list
+                existing = hooks.get("response") or []
+                hooks["response"] = ([existing] if callable(existing) else list(existing)) + [on_response]
+            _smartsheet_clients[key] = client
+        return client
+
+def hubspot_client(host:str = "https://api.hubapi.com", pool_size:int = 16):
+    """The shared HubSpot client for host.
+    The SDK builds a new ApiClient (and urllib3 pool) every time an api like crm.contacts.batch_api is read,
+    this one hands out an api instance per thread instead (each ApiClient keeps its own last_response)
+    and every instance of an api package sends through one pool of pool_size connections."""
+    key = (host, pool_size)
+    with _lock:
+        client = _hubspot_clients.get(key)
+        if client is None:
+            import hubspot
+            client = hubspot.Client.create(access_token=credential("hubspot_token"), host=host,
+                                           connection_pool_maxsize=pool_size, api_factory=_PooledApiFactory())
+            _hubspot_clients[key] = client
+        return client
+
+class _PooledApiFactory():
+    """hubspot.Client api_factory: one api instance per thread and api, one REST client (connection pool) per api package"""
+    def __init__(self):
+        self.local = threading.local()
+        self.rest_clients = {} #api package name -> RESTClientObject
+        self.lock = threading.Lock()
+
+    def __call__(self, package, api_name:str, config:dict):
+        apis = self.local.__dict__.setdefault("apis", {})
+        api = apis.get((package.__name__, api_name))
+        if api is None:
+            from hubspot.discovery.discovery_base import DiscoveryBase
+            api = DiscoveryBase._default_api_factory(package, api_name, config)
+            with self.lock:
+                rest_client = self.rest_clients.setdefault(package.__name__, api.api_client.rest_client)
+            api.api_client.rest_client = rest_client
+            apis[(package.__name__, api_name)] = api
+        return api
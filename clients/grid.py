@@ -1,15 +1,61 @@
 #!/usr/bin/env python
 
-import smartsheet
-import pandas as pd
 import datetime
 from datetime import date
-import time
-import math
 import json
+import gzip
+import pickle
+import threading
 from pathlib import Path
-import configs.crypter as crypter
-config = json.loads(Path("configs/config.json").read_text())
+from clients.client_factory import credential, smartsheet_client
+from configs.api_trace import endpoint_from_url
+from configs.settings import load_config
+from configs.lazy_import import lazy_import
+from clients.batch_executor import BatchExecutor
+# the SDK and pandas are imported on first use, importing grid only reads the (shared) config
+smartsheet = lazy_import("smartsheet")
+pd = lazy_import("pandas")
+config = load_config()
+
+# Smartsheet request sizing, rows/cells per add or update request and row ids per delete (ids go in the url)
+ROWS_PER_REQUEST = config.get("smartsheet_rows_per_request", 500)
+CELLS_PER_REQUEST = config.get("smartsheet_cells_per_request", 10000)
+IDS_PER_DELETE = 400
+IDS_PER_MOVE = 5000
+
+def _same_cell_value(current, new):
+    '''True if a value read into a grid df (typed by _apply_column_types) already matches the value about to be posted.
+    blanks (None, NaN, NaT, "") all match each other, otherwise compares as the posted type and then as text'''
+    if current is None or current is pd.NA or (isinstance(current, float) and current != current) or current is pd.NaT or current == "":
+        return new == "" or new is False # unchecked boxes can come back blank
+    if new == "":
+        return False
+    if isinstance(current, (int, float)) and not isinstance(current, bool) and not isinstance(new, bool):
+        try:
+            return float(current) == float(new) # numbers come back as floats
+        except (TypeError, ValueError):
+            return False
+    if isinstance(current, pd.Timestamp):
+        try:
+            return current == pd.Timestamp(new)
+        except (TypeError, ValueError):
+            return False
+    if isinstance(new, bool) and isinstance(current, str):
+        return current.lower() == str(new).lower() # checkbox posted to a text column
+    if isinstance(new, bool) or isinstance(current, bool):
+        return bool(current) == new
+    return current == new or str(current) == str(new)
+
+def smartsheet_retry_after(error, attempt):
+    '''throttle check for the BatchExecutor: retries errors the SDK flags as retryable (4003 rate limit,
+    4004 sheet busy with another request, 4002 timeout) with exponential backoff, or the Retry-After header if sent'''
+    if not (isinstance(error, smartsheet.exceptions.ApiError) and error.should_retry):
+        return None
+    response = getattr(error.error, "request_response", None)
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (AttributeError, TypeError, ValueError):
+        return min(2 ** attempt, 60)
 
 
 class grid:
@@ -35,11 +81,23 @@ class grid:
 
     Methods:
     --------
-    get_column_df() -> DataFrame:
-        Returns a DataFrame with details about the columns, such as title, type, options, etc.
+    get_column_df(refresh: bool=False) -> DataFrame:
+        Returns a DataFrame with details about the columns, such as title, type, options, etc. Cached per grid.
+
+    ensure_content() -> None:
+        Runs fetch_content only if the sheet hasn't been loaded on this grid yet.
+
+    invalidate(rows: bool=True, columns: bool=False) -> None:
+        Drops the cached rows and/or column schema. Writes that add or delete rows call this.
+
+    get_sheet_version() -> int:
+        Returns the sheet's current version number without downloading the sheet.
 
-    fetch_content() -> None:
+    fetch_content(use_cache: bool=False, incremental: bool=False) -> None:
         Fetches the sheet content from Smartsheet and sets various attributes like columns, rows, row IDs, etc.
+        With use_cache, skips the download when the sheet version matches the last fetch cached on disk.
+        With incremental, only rows modified since the last fetch are downloaded and merged into the cached df.
+        With columns/page_size, only the listed columns are requested and rows are paged in page_size chunks.
 
     fetch_summary_content() -> None:
         Fetches and constructs a summary DataFrame for summary columns.
@@ -53,11 +111,20 @@ class grid:
     delete_all_rows() -> None:
         Deletes all rows in the current sheet.
 
+    write_rows(action: str, items: List, to: int=None) -> List:
+        Adds, updates, deletes or moves rows in request-sized chunks, concurrently under the shared rate limit, with partial success.
+
+    archive_rows(row_ids: List[int], archive_id: int=None, archive_path: str=None) -> List[int]:
+        Moves rows to an archive sheet, or saves them to a local gzipped file and deletes them.
+
     post_new_rows(posting_data: List[Dict[str, Any]], post_fresh: bool=False, post_to_top: bool=False) -> None:
         Posts new rows to the Smartsheet. Can optionally delete the whole sheet before posting or set the position of the new rows.
 
     update_rows(posting_data: List[Dict[str, Any]], primary_key: str):
-        Updates rows that can be updated, posts rows that do not map to the sheet.
+        Updates rows that can be updated, posts rows that do not map to the sheet. Only cells that differ from the loaded sheet are sent.
+
+    row_index(primary_key: str, key: Callable=None) -> Dict:
+        Returns a cached {primary key value: row id} index of the loaded sheet.
 
     grab_posting_row_ids(posting_data: List[Dict[str, Any]], primary_key: str):
         returns a new posting_data called update_data that is a dictionary whose key is the row id, and whose value is the dictionary for the row <column name>:<field value>
@@ -70,68 +137,303 @@ class grid:
     """
 
     token = None
+    metrics = None # RunMetrics the sync sets, every Smartsheet response gets counted into it
+    _writer = None
+    _writer_lock = threading.Lock()
+
+    @property
+    def writer(self) -> BatchExecutor:
+        '''one writer for every grid in the process so all writes share Smartsheet's 300 requests/minute budget.
+        concurrency stays low: parallel writes to the same sheet get rejected with 4004 (and retried).
+        built on first write, its error type needs the SDK'''
+        with grid._writer_lock:
+            if grid._writer is None:
+                grid._writer = BatchExecutor(
+                    max_workers=config.get("smartsheet_max_concurrency", 2),
+                    rate=config.get("smartsheet_rate_limit", 300),
+                    per=60,
+                    retry_after=smartsheet_retry_after,
+                    errors=(smartsheet.exceptions.ApiError,),
+                )
+            return grid._writer
 
     def __init__(self, grid_id):
         self.grid_id = grid_id
         self.grid_content = None
-        self.token = crypter.decrypt_from_config("ss_automation_token")
+        # per-grid caches so one sync does one sheet read and one column read, see invalidate()
+        self._column_cache = None
+        self._content_loaded = False
+        self._row_index = {}
+        self.token = credential("ss_automation_token")
         if self.token == None:
             return "MUST SET TOKEN"
         else:
-            self.smart = smartsheet.Smartsheet(access_token=self.token)
-            self.smart.errors_as_exceptions(True)
+            # every grid shares one client and its keep-alive session
+            self.smart = smartsheet_client(
+                config.get("smartsheet_api_base", "https://api.smartsheet.com/2.0"),
+                config.get("smartsheet_pool_size", 8),
+                on_response=grid._record_response,
+            )
+    @classmethod
+    def _record_response(cls, response, *args, **kwargs):
+        '''requests response hook, counts and traces each http call (retries included) in grid.metrics'''
+        if cls.metrics is not None:
+            request = response.request
+            body = request.body or b""
+            cls.metrics.record_api(
+                "smartsheet",
+                len(response.content or b""),
+                endpoint=endpoint_from_url(request.method, request.url),
+                seconds=response.elapsed.total_seconds(),
+                status=response.status_code,
+                bytes_out=len(body.encode() if isinstance(body, str) else body) if not hasattr(body, "read") else 0,
+                headers=response.headers,
+            )
 #region core get requests   
-    def get_column_df(self):
-        '''returns a df with data on the columns: title, type, options, etc...'''
+    def get_column_df(self, refresh=False):
+        '''returns a df with data on the columns: title, type, options, etc...
+        cached on the grid after the first call, refresh=True (or invalidate(columns=True)) re-reads it'''
         if self.token == None:
             return "MUST SET TOKEN"
+        elif self._column_cache is not None and not refresh:
+            return self._column_cache
         else:
-            return pd.DataFrame.from_dict(
+            self._column_cache = pd.DataFrame.from_dict(
                 (self.smart.Sheets.get_columns(
                     self.grid_id, 
                     level=2, 
                     include='objectValue', 
                     include_all=True)
                 ).to_dict().get("data"))
-    def fetch_content(self):
+            return self._column_cache
+    def ensure_content(self):
+        '''fetches the sheet only if this grid hasn't loaded it yet (or it was invalidated)'''
+        if not self._content_loaded:
+            self.fetch_content()
+    def invalidate(self, rows=True, columns=False):
+        '''drops the cached sheet content (rows) and/or column schema so the next read goes back to Smartsheet.
+        called after writes that add or remove rows'''
+        if rows:
+            self._content_loaded = False
+            self._row_index = {}
+        if columns:
+            self._column_cache = None
+    def row_index(self, primary_key, key=None):
+        '''returns {primary key value: row id} for the loaded sheet (fetched if needed), built once per fetch and reused.
+        key = function applied to the values (e.g. str.lower), blank values are left out and the last row wins on duplicates.
+        the dict is shared, copy it before changing it'''
+        self.ensure_content()
+        index_key = (primary_key, key)
+        if index_key not in self._row_index:
+            column = self.df[primary_key]
+            present = column.notna().to_numpy()
+            values = column[present].tolist()
+            if key:
+                values = [key(value) for value in values]
+            self._row_index[index_key] = dict(zip(values, self.df["id"][present].tolist()))
+        return self._row_index[index_key]
+    def get_sheet_version(self):
+        '''returns the sheet's version number without loading the sheet (cheap call)'''
+        return self.smart.Sheets.get_sheet_version(self.grid_id).version
+    def fetch_content(self, use_cache=False, incremental=False, columns=None, page_size=None):
         '''this fetches data, ask coby why this is seperated
-        when this is done, there are now new objects created for various scenarios-- column_ids, row_ids, and the main sheet df'''
+        when this is done, there are now new objects created for various scenarios-- column_ids, row_ids, and the main sheet df
+        use_cache = check the sheet version first, if it matches the last fetch saved on disk load that instead of downloading the sheet
+        incremental = when the sheet has changed, only download rows modified since the last fetch and merge them into the cached df.
+            changed_row_ids / deleted_row_ids are set to what moved since the last fetch
+        columns = list of column titles to fetch, only those columns are requested and end up in df
+        page_size = rows per request, the df is built page by page (defaults to 500 when columns are given)'''
         if self.token == None:
             return "MUST SET TOKEN"
-        else:
-            self.grid_content = (self.smart.Sheets.get_sheet(self.grid_id)).to_dict()
-            self.grid_name = (self.grid_content).get("name")
-            self.grid_url = (self.grid_content).get("permalink")
-            # this attributes pulls the column headers
-            self.grid_columns = [i.get("title") for i in (self.grid_content).get("columns")]
-            # note that the grid_rows is equivelant to the cell's 'Display Value'
-            self.grid_rows = []
-            if (self.grid_content).get("rows") == None:
-                self.grid_rows = []
-            else:
-                for i in (self.grid_content).get("rows"):
-                    b = i.get("cells")
-                    c = []
-                    for i in b:
-                        l = i.get("displayValue")
-                        m = i.get("value")
-                        if l == None:
-                            c.append(m)
-                        else:
-                            c.append(l)
-                    (self.grid_rows).append(c)
-            
-            # resulting fetched content
-            self.grid_rows = self.grid_rows
-            if (self.grid_content).get("rows") == None:
-                self.grid_row_ids = []
-            else:
-                self.grid_row_ids = [i.get("id") for i in (self.grid_content).get("rows")]
-            self.grid_column_ids = [i.get("id") for i in (self.grid_content).get("columns")]
-            self.df = pd.DataFrame(self.grid_rows, columns=self.grid_columns)
-            # Should be row_id intead of id as that is less likely to be taken name space!!!
-            self.df["id"]=self.grid_row_ids
+        self._column_filter = self._column_ids_for(columns) if columns else None
+        self._row_index = {}
+        cached = None
+        if use_cache or incremental:
+            fetched_at = datetime.datetime.now(datetime.timezone.utc)
+            version = self.get_sheet_version()
+            cached = self._read_cache()
+            if cached and cached.get("grid_version") == version:
+                self._restore_cache(cached)
+                self.changed_row_ids, self.deleted_row_ids = [], []
+                self._content_loaded = True
+                return
+            if incremental and cached and self._fetch_modified_rows(cached, page_size or 500):
+                self.fetched_at = fetched_at
+                self._save_cache()
+                self._content_loaded = True
+                return
+            self.fetched_at = fetched_at
+        if columns or page_size:
             self.column_df = self.get_column_df()
+            self._fetch_pages(page_size or 500)
+            self._apply_column_types()
+            self.changed_row_ids, self.deleted_row_ids = list(self.grid_row_ids), []
+            self._content_loaded = True
+            if use_cache or incremental:
+                self._save_cache()
+            return
+        self.grid_content = (self.smart.Sheets.get_sheet(self.grid_id)).to_dict()
+        self.grid_version = (self.grid_content).get("version")
+        self.grid_name = (self.grid_content).get("name")
+        self.grid_url = (self.grid_content).get("permalink")
+        # this attributes pulls the column headers
+        self.grid_columns = [i.get("title") for i in (self.grid_content).get("columns")]
+        # note that the grid_rows is equivelant to the cell's 'Display Value'
+        self.column_df = self.get_column_df()
+        self.grid_rows = self._row_values((self.grid_content).get("rows"), self._value_column_ids())
+        
+        # resulting fetched content
+        if (self.grid_content).get("rows") == None:
+            self.grid_row_ids = []
+        else:
+            self.grid_row_ids = [i.get("id") for i in (self.grid_content).get("rows")]
+        self.grid_column_ids = [i.get("id") for i in (self.grid_content).get("columns")]
+        self.df = pd.DataFrame(self.grid_rows, columns=self.grid_columns)
+        # Should be row_id intead of id as that is less likely to be taken name space!!!
+        self.df["id"]=self.grid_row_ids
+        self._apply_column_types()
+        self.changed_row_ids, self.deleted_row_ids = list(self.grid_row_ids), []
+        self._content_loaded = True
+        if use_cache or incremental:
+            self._save_cache()
+    def _row_values(self, rows, value_column_ids=frozenset()):
+        '''turns the rows of a get_sheet response into lists of cell values (display value when there is one,
+        except for value_column_ids whose raw value is kept so they can be typed)'''
+        grid_rows = []
+        for i in rows or []:
+            b = i.get("cells")
+            c = []
+            for i in b:
+                l = i.get("displayValue")
+                m = i.get("value")
+                if l == None or i.get("columnId") in value_column_ids:
+                    c.append(m)
+                else:
+                    c.append(l)
+            grid_rows.append(c)
+        return grid_rows
+    def _column_ids_for(self, titles):
+        '''column ids for the given titles, in sheet order'''
+        column_df = self.get_column_df()
+        missing = set(titles) - set(column_df['title'])
+        if missing:
+            raise ValueError(f"Sheet {self.grid_id} has no columns titled {sorted(missing)}")
+        return column_df.loc[column_df['title'].isin(titles), 'id'].tolist()
+    def _fetch_pages(self, page_size):
+        '''pages through the sheet (only the filtered columns if set) and builds df column by column,
+        reading cells straight off the response models instead of to_dict()-ing the whole sheet'''
+        titles = None
+        values = {}
+        value_column_ids = self._value_column_ids()
+        self.grid_row_ids = []
+        page = 1
+        while True:
+            sheet = self.smart.Sheets.get_sheet(self.grid_id, column_ids=self._column_filter, page_size=page_size, page=page)
+            if titles is None:
+                self.grid_version, self.grid_name, self.grid_url = sheet.version, sheet.name, sheet.permalink
+                self.grid_column_ids = [column.id for column in sheet.columns]
+                titles = {column.id: column.title for column in sheet.columns}
+                values = {column_id: [] for column_id in titles}
+            for row in sheet.rows:
+                self.grid_row_ids.append(row.id)
+                seen = set()
+                for cell in row.cells:
+                    if cell.column_id in values:
+                        raw = cell.display_value is None or cell.column_id in value_column_ids
+                        values[cell.column_id].append(cell.value if raw else cell.display_value)
+                        seen.add(cell.column_id)
+                for column_id in values.keys() - seen: # cells can be left out of the response when empty
+                    values[column_id].append(None)
+            if not sheet.rows or len(self.grid_row_ids) >= (sheet.total_row_count or 0):
+                break
+            page += 1
+        self.grid_content = None
+        self.grid_columns = [titles[column_id] for column_id in self.grid_column_ids]
+        self.grid_rows = None # df holds the rows, no second row-major copy
+        self.df = pd.DataFrame({titles[column_id]: values[column_id] for column_id in self.grid_column_ids})
+        self.df["id"] = self.grid_row_ids
+    def _fetch_modified_rows(self, cached, page_size=500):
+        '''pulls rows modified since the cached fetch plus a one-column row id listing (to spot deletions), both paged in
+        page_size chunks like _fetch_pages, and merges them into the cached df. returns False if the columns changed and a full fetch is needed'''
+        since = cached.get("fetched_at")
+        if since is None:
+            return False
+        since = (since - datetime.timedelta(minutes=5)).isoformat(timespec="seconds") # margin for clock skew, re-pulled rows are harmless
+        value_column_ids = self._value_column_ids()
+        modified_values, modified_ids = [], []
+        page = 1
+        while True:
+            sheet = (self.smart.Sheets.get_sheet(self.grid_id, rows_modified_since=since, column_ids=self._column_filter, page_size=page_size, page=page)).to_dict()
+            if page == 1:
+                if [i.get("id") for i in sheet.get("columns")] != cached.get("grid_column_ids"):
+                    return False
+                version = sheet.get("version")
+            rows = sheet.get("rows") or []
+            modified_values.extend(self._row_values(rows, value_column_ids))
+            modified_ids.extend(i.get("id") for i in rows)
+            if len(rows) < page_size or len(modified_ids) >= (sheet.get("totalRowCount") or 0):
+                break
+            page += 1
+        live_ids = self._list_row_ids(cached.get("grid_column_ids")[:1], page_size)
+        self._restore_cache(cached)
+        self.grid_version = version
+
+        changes = pd.DataFrame(modified_values, columns=self.grid_columns)
+        changes["id"] = modified_ids
+        # drop stale copies of modified rows, add the fresh ones, keep only live rows in sheet order
+        merged = pd.concat([self.df[~self.df["id"].isin(changes["id"])], changes], ignore_index=True)
+        merged = merged.set_index("id").reindex(live_ids).reset_index()
+        self.df = merged[self.grid_columns + ["id"]]
+        self._apply_column_types()
+        self.grid_row_ids = live_ids
+        self.grid_rows = self.df[self.grid_columns].values.tolist() if cached.get("grid_rows") is not None else None
+        self.changed_row_ids = changes["id"].tolist()
+        self.deleted_row_ids = sorted(set(cached.get("grid_row_ids")) - set(live_ids))
+        return True
+    def _list_row_ids(self, column_ids, page_size):
+        '''every row id in the sheet in sheet order, paged and with only column_ids requested'''
+        row_ids = []
+        page = 1
+        while True:
+            sheet = self.smart.Sheets.get_sheet(self.grid_id, column_ids=column_ids, page_size=page_size, page=page)
+            row_ids.extend(row.id for row in sheet.rows)
+            if not sheet.rows or len(row_ids) >= (sheet.total_row_count or 0):
+                return row_ids
+            page += 1
+    # Smartsheet column types that are read from the raw cell value (not the display value) and typed
+    date_types = {"DATE", "DATETIME", "ABSTRACT_DATETIME"}
+    value_types = date_types | {"CHECKBOX"}
+    # text columns with at most this share of distinct values are stored as categoricals
+    category_ratio = 0.5
+    def _value_column_ids(self):
+        column_df = self.get_column_df()
+        if "type" not in column_df:
+            return set()
+        return set(column_df.loc[column_df["type"].isin(self.value_types), "id"])
+    def _apply_column_types(self):
+        '''uses the column metadata from get_column_df to type df: dates -> datetime64 (unparseable cells become NaT, with a warning),
+        checkboxes -> boolean, PICKLIST -> categorical (with the column's options as categories), low-cardinality text -> categorical'''
+        column_df = self.get_column_df()
+        if "type" not in column_df:
+            return
+        options = column_df["options"] if "options" in column_df else [None] * len(column_df)
+        for title, column_type, column_options in zip(column_df["title"], column_df["type"], options):
+            if title not in self.df.columns or title == "id":
+                continue
+            column = self.df[title]
+            if column_type in self.date_types:
+                dates = pd.to_datetime(column, errors="coerce")
+                coerced = int((dates.isna() & column.notna() & (column.astype(str).str.strip() != "")).sum())
+                if coerced:
+                    print(f"Warning: {coerced} cells in date column '{title}' aren't dates and were read as NaT")
+                self.df[title] = dates
+            elif column_type == "CHECKBOX":
+                self.df[title] = column.astype("boolean")
+            elif column_type == "PICKLIST":
+                categories = list(dict.fromkeys(list(column_options if isinstance(column_options, list) else []) + column.dropna().tolist()))
+                self.df[title] = pd.Categorical(column, categories=categories)
+            elif column_type == "TEXT_NUMBER" and len(column) and column.nunique() <= len(column) * self.category_ratio:
+                self.df[title] = column.astype("category")
     def fetch_summary_content(self):
         '''builds the summary df for summary columns'''
         if self.token == None:
@@ -156,6 +458,33 @@ class grid:
                 self.grid_row_ids = [i.get("id") for i in (self.grid_content).get("data")]
             self.df = pd.DataFrame(self.grid_rows, columns=self.summary_params)
 #endregion 
+#region fetch cache
+    cached_attributes = ["grid_version", "fetched_at", "grid_name", "grid_url", "grid_columns", "grid_rows", "grid_row_ids", "grid_column_ids", "df", "column_df"]
+    def _cache_path(self):
+        # column-filtered fetches get their own cache file
+        column_filter = getattr(self, "_column_filter", None)
+        suffix = f"-{abs(hash(tuple(column_filter)))}" if column_filter else ""
+        return Path(config.get("sheet_cache_dir", "configs/cache")) / f"{self.grid_id}{suffix}.pkl"
+    def _read_cache(self):
+        '''returns the last fetch saved on disk, None if there isn't a usable one'''
+        path = self._cache_path()
+        if not path.exists():
+            return None
+        try:
+            return pickle.loads(path.read_bytes())
+        except Exception:
+            return None # unreadable cache is just a miss
+    def _restore_cache(self, cached):
+        for attribute in self.cached_attributes:
+            setattr(self, attribute, cached.get(attribute))
+        self.grid_content = None
+        self._column_cache = self.column_df
+    def _save_cache(self):
+        '''saves the current fetch to disk, keyed by the sheet version it was taken at'''
+        path = self._cache_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(pickle.dumps({attribute: getattr(self, attribute, None) for attribute in self.cached_attributes}))
+#endregion
 #region helpers     
     def reduce_columns(self,exclusion_string):
         """a method on a grid{sheet_id}) object
@@ -182,22 +511,19 @@ class grid:
         if filtered_column_title_list == "all_columns":
             filtered_column_title_list = column_df['title'].tolist()
     
-        self.column_id_dict = {title: column_df.loc[column_df['title'] == title]['id'].tolist()[0] for title in filtered_column_title_list}
+        title_to_id = {}
+        for title, column_id in zip(column_df['title'], column_df['id']):
+            title_to_id.setdefault(title, column_id) # first column wins on duplicate titles
+        missing = [title for title in filtered_column_title_list if title not in title_to_id]
+        if missing:
+            raise IndexError(f"No columns titled {missing}")
+        self.column_id_dict = {title: title_to_id[title] for title in filtered_column_title_list}
     def delete_all_rows(self):
-        '''deletes up to 400 rows in 200 row chunks by grabbing row ids and deleting them one at a time in a for loop
+        '''deletes every row in the sheet through write_rows
         [NOT USED INDEPENDENTLY, BUT USED INSIDE OF POST_NEW_ROWS]'''
-        self.fetch_content()
-
-        row_list_del = []
-        for rowid in self.df['id'].to_list():
-            row_list_del.append(rowid)
-            # Delete rows to sheet by chunks of 200
-            if len(row_list_del) > 199:
-                self.smart.Sheets.delete_rows(self.grid_id, row_list_del)
-                row_list_del = []
-        # Delete remaining rows
-        if len(row_list_del) > 0:
-            self.smart.Sheets.delete_rows(self.grid_id, row_list_del) 
+        self.ensure_content()
+        self.write_rows("delete", self.df['id'].to_list())
+        self.invalidate()
     def post_new_rows(self, posting_data, post_fresh = False, post_to_top=False, parent_id=None):
         '''posts new row to sheet, does not account for various column types at the moment
         posting data is a list of dictionaries, one per row, where the key is the name of the column, and the value is the value you want to post
@@ -206,7 +532,6 @@ class grid:
         post_fresh = first delete the whole sheet, then post (else it will just update existing sheet)
         TODO: if using post_to_top==False, I should really delete the empty rows in the sheet so it will properly post to bottom'''
         
-        posting_sheet_id = self.grid_id
         column_title_list = list(posting_data[0].keys())
         try:
             self.grab_posting_column_ids(column_title_list)
@@ -237,9 +562,106 @@ class grid:
                         'value': item[key]
                         })
             rows.append(row)
-        self.post_response = self.smart.Sheets.add_rows(posting_sheet_id, rows)
+        self.post_response = self.write_rows("add", rows)
+        self.posted_rows = [row for response in self.post_response for row in (response.result or [])]
+        self.failed_posts = self.failed_rows
+        self.invalidate() # new rows aren't in the cached df/row index
+
+    def posted_row_ids(self, primary_key, key=None):
+        '''returns {primary key value: row id} for the rows created by the last post_new_rows call'''
+        column_id = getattr(self, "column_id_dict", {}).get(primary_key)
+        posted = {}
+        for row in getattr(self, "posted_rows", None) or []:
+            for cell in row.cells:
+                if cell.column_id == column_id and cell.value is not None:
+                    posted[key(cell.value) if key else cell.value] = row.id
+        return posted
+    def failed_row_keys(self, rows, primary_key, key=None):
+        '''returns the primary key values of rows that failed to write (failed_updates / failed_posts).
+        update rows don't carry the primary key cell, those are looked up in the last update_data'''
+        column_id = getattr(self, "column_id_dict", {}).get(primary_key)
+        update_data = getattr(self, "update_data", None) or {}
+        keys = set()
+        for row in rows:
+            value = update_data[row.id].get(primary_key) if row.id in update_data else None
+            if value is None:
+                value = next((cell.value for cell in row.cells if str(cell.column_id) == str(column_id)), None)
+            if value is not None:
+                keys.add(key(value) if key else value)
+        return keys
 
     #endregion
+    #region batch writer
+    def write_rows(self, action, items, to=None):
+        '''sends rows to Smartsheet in request-sized chunks through the shared writer (concurrent, rate limited,
+        throttled chunks retried with backoff). adds/updates use partial success so one bad row doesn't reject its chunk.
+        action = "add", "update" (items are smartsheet Rows), "delete" or "move" (items are row ids, moved to the sheet id `to`)
+        returns the responses in chunk order, rows that still failed are collected on self.failed_rows'''
+        if action == "delete":
+            chunks = [items[i:i + IDS_PER_DELETE] for i in range(0, len(items), IDS_PER_DELETE)]
+            send = lambda chunk: self.smart.Sheets.delete_rows(self.grid_id, chunk, ignore_rows_not_found=True)
+        elif action == "move":
+            chunks = [items[i:i + IDS_PER_MOVE] for i in range(0, len(items), IDS_PER_MOVE)]
+            send = lambda chunk: self.smart.Sheets.move_rows(self.grid_id, smartsheet.models.CopyOrMoveRowDirective({
+                "row_ids": chunk, "to": smartsheet.models.CopyOrMoveRowDestination({"sheet_id": to})
+            }), ignore_rows_not_found=True)
+        else:
+            chunks = self._chunk_rows(items)
+            if action == "add":
+                send = lambda chunk: self.smart.Sheets.add_rows_with_partial_success(self.grid_id, chunk)
+            else:
+                send = lambda chunk: self.smart.Sheets.update_rows_with_partial_success(self.grid_id, chunk)
+        self.failed_rows = []
+        responses = []
+        for i, result in enumerate(self.writer.run(chunks, send)):
+            if not result.ok:
+                print(f"Batch {i + 1}/{len(chunks)}: {action} of {len(result.chunk)} rows failed: {result.error}")
+                self.failed_rows.extend(result.chunk)
+                continue
+            responses.append(result.response)
+            for failure in getattr(result.response, "failed_items", None) or []:
+                print(f"Batch {i + 1}/{len(chunks)}: row {failure.index} ({failure.row_id}) failed: {failure.error}")
+                self.failed_rows.append(result.chunk[failure.index])
+        print(f"{action}: {sum(len(chunk) for chunk in chunks) - len(self.failed_rows)}/{sum(len(chunk) for chunk in chunks)} rows in {len(chunks)} requests")
+        return responses
+    def archive_rows(self, row_ids, archive_id=None, archive_path=None):
+        '''takes rows off the sheet without losing them: moved to the sheet archive_id (needs the same column titles),
+        or appended to archive_path as gzipped JSON lines and then deleted.
+        archived rows are dropped from the loaded df so it stays usable without a re-fetch
+        returns the row ids that were archived'''
+        self.ensure_content()
+        row_ids = list(row_ids)
+        if not row_ids:
+            return []
+        if archive_id:
+            self.write_rows("move", row_ids, to=archive_id)
+        else:
+            archived_at = datetime.datetime.now().isoformat(timespec="seconds")
+            rows = self.df[self.df["id"].isin(row_ids)].astype(object)
+            records = rows.where(rows.notna(), None).to_dict("records")
+            with gzip.open(archive_path, "at", encoding="utf-8") as file:
+                for record in records:
+                    record["archived_at"] = archived_at
+                    file.write(json.dumps(record, default=str) + "\n")
+            self.write_rows("delete", row_ids)
+        failed = set(self.failed_rows)
+        archived = [row_id for row_id in row_ids if row_id not in failed]
+        self.df = self.df[~self.df["id"].isin(archived)].reset_index(drop=True)
+        self._row_index = {}
+        return archived
+    def _chunk_rows(self, rows):
+        '''splits rows so each request stays under ROWS_PER_REQUEST rows and CELLS_PER_REQUEST cells'''
+        chunks, chunk, cells = [], [], 0
+        for row in rows:
+            if chunk and (len(chunk) >= ROWS_PER_REQUEST or cells + len(row.cells) > CELLS_PER_REQUEST):
+                chunks.append(chunk)
+                chunk, cells = [], 0
+            chunk.append(row)
+            cells += len(row.cells)
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+    #endregion
     #region post timestamp
     def handle_update_stamps(self):
         '''grabs summary id, and then runs the function that posts the date'''
@@ -288,7 +710,7 @@ class grid:
         )
     #endregion
     #region post row update
-    def grab_posting_row_ids(self, posting_data, primary_key, skip_nonmatch=False):
+    def grab_posting_row_ids(self, posting_data, primary_key, skip_nonmatch=False, row_ids=None, key=None):
         '''Prepares for an update by reorganizing the posting data with the row_id as the key and the value as the data.    
 
         Parameters:
@@ -296,6 +718,8 @@ class grid:
         - primary_key: A key from `posting_data` that serves as the reference to map row IDs to the posting data (must be case-sensitive match). 
             In otherwords, the primary_key is a str that matches one of the keys from the posting_data. This key represents the column that will be used to extract Row_IDs by finding the first row to match each posting_data's primary key value, and calling that the row Id for that dictionary
         - skip_nonmatch (optional, default=True): Determines the handling of non-matching primary keys. When set to `True`, rows with non-matching primary keys are ignored. When `False`, these rows are collected into a "new_rows" key in the resulting dictionary.  
+        - row_ids (optional): already known {primary key value: row_id} mapping (e.g. from a local state store). When given the sheet is not re-fetched.
+        - key (optional): function applied to primary key values on both sides before matching (e.g. str.lower)
 
         Process:
         1. Identify the value associated with the `primary_key` in `posting_data`.
@@ -303,11 +727,15 @@ class grid:
         3. Return a dictionary: keys are row_ids (or "new_rows" for unmatched rows), values are the corresponding `posting_data` for each row.
         '''
 
-        self.fetch_content()
+        if row_ids is None:
+            self.ensure_content()
+            sheet_empty = self.df.empty
+        else:
+            sheet_empty = not row_ids
 
-        if not self.df.empty:
+        if not sheet_empty:
             # Mapping of the primary key values to their corresponding row IDs from the current Smartsheet data
-            primary_to_row_id = dict(zip(self.df[primary_key], self.df['id']))  
+            primary_to_row_id = row_ids if row_ids is not None else self.row_index(primary_key, key)
 
             # Dictionary to hold the mapping of row IDs to their posting data
             update_data = {}
@@ -315,6 +743,8 @@ class grid:
 
             for data in posting_data:
                 primary_value = data.get(primary_key)
+                if key and primary_value is not None:
+                    primary_value = key(primary_value)
                 if primary_value in primary_to_row_id:
                     row_id = primary_to_row_id[primary_value]
                     update_data[row_id] = data
@@ -331,123 +761,93 @@ class grid:
             return update_data
         else:
             raise ValueError("Grid Instance is not appropriate for this task. Try create a new grid instance")
-    def update_rows(self, posting_data, primary_key, update_type='default'):
+    def update_rows(self, posting_data, primary_key, update_type='default', row_ids=None, key=None, skip_unchanged=True, touch_columns=()):
         '''
         Updates rows (and adds misc rows) in the Smartsheet based on the provided posting data.  
 
         Parameters:
         - posting_data (list of dicts)
         - primary_key (string which is equal to a key of one of the items in all dictionaries)
+        - row_ids, key: passed through to grab_posting_row_ids
+        - skip_unchanged: if the sheet is already loaded, only send the cells that differ from self.df and skip rows with no differences
+        - touch_columns: columns (e.g. a timestamp) that are sent along with a row's changes but don't count as a change on their own
 
         Returns:
-        None. Updates and possibly adds rows in the Smartsheet.
+        None. Updates and possibly adds rows in the Smartsheet. Rows rejected by partial success end up in
+        self.failed_updates / self.failed_posts (see failed_row_keys).
         '''
         posting_sheet_id = self.grid_id
-        column_title_list = list(posting_data[0].keys())
+        column_title_list = list(dict.fromkeys(title for data in posting_data for title in data)) # rows don't all post the same columns
         try:
             self.grab_posting_column_ids(column_title_list)
         except IndexError:
             raise ValueError("Index Error reveals that your posting_data dictionary has key(s) that don't match the column names on the Smartsheet")
-        self.update_data = self.grab_posting_row_ids(posting_data, primary_key)
+        self.update_data = self.grab_posting_row_ids(posting_data, primary_key, row_ids=row_ids, key=key)
+        self.failed_updates = []
+        self.failed_posts = [] # set by post_new_rows when unmatched rows get posted below
+        rows = self._build_update_rows(primary_key, skip_unchanged, touch_columns)
 
         if update_type =='debug':
-            # Handle existing rows' updates (printing each row)
-            for i, row_id in enumerate(self.update_data.keys()):
-                if row_id != "new_rows":
-                    # Build the row to update
-                    new_row = smartsheet.models.Row()
-                    new_row.id = row_id
-                    for column_name in self.column_id_dict.keys():
-                        # does not post repost primary key
-                        if column_name != primary_key:
-                            # Build new cell value
-                            new_cell = smartsheet.models.Cell()
-                            new_cell.column_id = int(self.column_id_dict[column_name])
-                            # stops error where post doesnt go through because value is "None"
-                            if self.update_data[row_id].get(column_name) != None:
-                                print(f"{i+1}/{len(self.update_data.keys())}  ", self.update_data[row_id].get(column_name))
-                                new_cell.value = self.update_data[row_id].get(column_name)
-                            else:
-                                new_cell.value = ""
-                            new_cell.strict = False
-                            new_row.cells.append(new_cell)
-
-                    # Update rows
-                    self.update_response = self.smart.Sheets.update_rows(
-                      posting_sheet_id ,      # sheet_id
-                      [new_row])
+            # Handle existing rows' updates (one request per row)
+            for i, new_row in enumerate(rows):
+                print(f"{i+1}/{len(rows)}  ", [cell.value for cell in new_row.cells])
+                self.update_response = self.smart.Sheets.update_rows(
+                  posting_sheet_id ,      # sheet_id
+                  [new_row])
                     
-        elif update_type == 'batch':
-            rows = []
-            counter = 1
-            batch_total = int(math.ceil(len(self.update_data.keys()) / 350))
-            self.update_response = []       
-
-            for i, row_id in enumerate(self.update_data.keys()):
-                if row_id != "new_rows":
-                    new_row = smartsheet.models.Row()
-                    new_row.id = row_id
-                    for column_name in self.column_id_dict.keys():
-                        if column_name != primary_key:
-                            new_cell = smartsheet.models.Cell()
-                            new_cell.column_id = int(self.column_id_dict[column_name])
-                            new_cell.value = self.update_data[row_id].get(column_name, "")  # Use get method to handle None
-                            new_cell.strict = False
-                            new_row.cells.append(new_cell)
-                    rows.append(new_row)  # Properly add the new_row to the rows list       
-
-                # When 350 rows are collected or at the end of the data
-                if (i + 1) % 350 == 0 or (i + 1) == len(self.update_data.keys()):
-                    # Send the batch update
-                    self.update_response.append(self.smart.Sheets.update_rows(
-                        posting_sheet_id,
-                        rows  # Now passing the entire list of rows
-                    ))
-                    print(f"Batch {counter}/{batch_total}: updated {i + 1}/{len(self.update_data.keys())} in smartsheet")
-                    time.sleep(2)  # Optional: sleep to avoid hitting rate limits or as needed
-                    counter += 1
-                    rows = []  # Reset the rows list for the next batch     
-
-            # After the loop, check if there's any leftover rows to update
-            if rows:
-                self.update_response.append(self.smart.Sheets.update_rows(
-                    posting_sheet_id,
-                    rows
-                ))
-                print(f"Final batch: updated remaining {len(rows)} rows in smartsheet")
-
-        elif update_type == 'default':
-            rows = []
-            # Handle existing rows' updates
-            for row_id in self.update_data.keys():
-                if row_id != "new_rows":
-                    # Build the row to update
-                    new_row = smartsheet.models.Row()
-                    new_row.id = row_id
-                    for column_name in self.column_id_dict.keys():
-                        # does not post repost primary key
-                        if column_name != primary_key:
-                            # Build new cell value
-                            new_cell = smartsheet.models.Cell()
-                            new_cell.column_id = int(self.column_id_dict[column_name])
-                            # stops error where post doesnt go through because value is "None"
-                            if self.update_data[row_id].get(column_name) != None:
-                                new_cell.value = self.update_data[row_id].get(column_name)
-                            else:
-                                new_cell.value = ""
-                            new_cell.strict = False
-                            new_row.cells.append(new_cell)
-                    rows.append(new_row)
-
-            # Update rows
-            self.update_response = self.smart.Sheets.update_rows(
-              posting_sheet_id ,      # sheet_id
-              rows)
+        elif update_type in ('batch', 'default'):
+            # both go through write_rows, which sizes the requests to Smartsheet's limits
+            self.update_response = self.write_rows("update", rows)
+            self.failed_updates = self.failed_rows
+        if rows:
+            self.invalidate() # df no longer matches the sheet
 
         try:
             # Handle addition of new rows if the "new_rows" key is present
             self.post_new_rows(self.update_data.get('new_rows'))
         except TypeError:
             pass
+    def _build_update_rows(self, primary_key, skip_unchanged=True, touch_columns=()):
+        '''builds a smartsheet Row per matched row in self.update_data with a cell for each posted column (except the primary key).
+        when the sheet content is loaded and skip_unchanged is set, cells equal to the current value in self.df are left out
+        and rows left with only touch_columns (or nothing) are skipped'''
+        row_ids = [row_id for row_id in self.update_data if row_id != "new_rows"]
+        current = {}
+        if skip_unchanged and self._content_loaded and not self.df.empty:
+            columns = [title for title in self.column_id_dict if title in self.df.columns and title != primary_key]
+            loaded = self.df[self.df["id"].isin(row_ids)]
+            current = dict(zip(loaded["id"], loaded[columns].to_dict("records")))
+        rows = []
+        skipped = 0
+        for row_id in row_ids:
+            data = self.update_data[row_id]
+            existing = current.get(row_id)
+            # Build the row to update
+            new_row = smartsheet.models.Row()
+            new_row.id = row_id
+            changed = existing is None # rows not in the loaded df are always written
+            for column_name, value in data.items():
+                # does not post repost primary key
+                if column_name == primary_key:
+                    continue
+                # stops error where post doesnt go through because value is "None"
+                value = "" if value is None else value
+                if existing is not None and column_name in existing:
+                    if _same_cell_value(existing[column_name], value):
+                        continue
+                    changed = changed or column_name not in touch_columns
+                # Build new cell value
+                new_cell = smartsheet.models.Cell()
+                new_cell.column_id = int(self.column_id_dict[column_name])
+                new_cell.value = value
+                new_cell.strict = False
+                new_row.cells.append(new_cell)
+            if changed and new_row.cells:
+                rows.append(new_row)
+            else:
+                skipped += 1
+        if current:
+            print(f"update: {len(rows)} rows changed, {skipped} unchanged rows skipped")
+        return rows
     #endregion
 #endregion
\ No newline at end of file
@@ -1,23 +1,35 @@
 #region ---- Imports ----
-from dataclasses import asdict
 import json
-import hubspot
 from pprint import pprint
-from hubspot.crm.contacts import (
-    SimplePublicObjectInput, #batch create
-    BatchInputSimplePublicObjectBatchInputForCreate, #batch create
-    SimplePublicUpsertObject, #batch update
-    BatchInputSimplePublicObjectBatchInputUpsert, #batch update
-    BatchInputSimplePublicObjectId, #batch delete
-    ApiException, 
-    )
 from datetime import datetime
+from time import perf_counter
+from copy import deepcopy
+import queue
+import threading
 # Local imports
-import configs.crypter as crypter
+from clients.client_factory import credential, hubspot_client
 from configs.setup_logger import setup_logger
+from configs.settings import load_config
+from configs.lazy_import import lazy_import
 from configs.dataclasses import Employee
+from configs.diff_engine import normalize_email
+from clients.batch_executor import BatchExecutor, TokenBucket, http_retry_after
+# SDK batch models and ApiException, imported on first use so importing the client stays quick
+contacts_sdk = lazy_import("hubspot.crm.contacts")
 #endregion
 
+SEARCH_RESULT_CEILING = 10000 # CRM search refuses to page past 10k hits for one query
+# Employee field -> HubSpot contact property
+PROPERTY_MAP = {
+    "email": "email",
+    "first_name": "firstname",
+    "last_name": "lastname",
+    "state": "state",
+    "region": "dowbuilt_region",
+    "marketing_classification": "marketing_classification",
+    "company": "associatedcompanyid",
+}
+
 class HubspotClient():
     def __init__(self):
         #Logger
@@ -25,9 +37,108 @@ class HubspotClient():
         # Const variables
         config = self.load_config()
         self.HB_DB_COMPANY_ID = config.get("HB_DB_COMPANY_ID")
+        self.dump_json = config.get("dump_json", False) #write hubspot.json for debugging
         # tokens / client
-        self.hb_token = crypter.decrypt_from_config("hubspot_token")
-        self.hub = hubspot.Client.create(access_token=self.hb_token)
+        self.hb_token = credential("hubspot_token")
+        # shared client, every phase and thread reuses the same keep-alive connections
+        self.hub = hubspot_client(config.get("hubspot_host", "https://api.hubapi.com"), config.get("hubspot_pool_size", 16))
+        # batch writes share one executor so every phase draws from the same rate limit budget
+        self.executor = BatchExecutor(
+            max_workers=config.get("hubspot_max_concurrency", 4),
+            rate=config.get("hubspot_rate_limit", 100), #requests per 10 seconds
+            per=10,
+            errors=(contacts_sdk.ApiException,),
+        )
+        # search has its own (lower) per-second limit, shared by every partition
+        self.search_bucket = TokenBucket(config.get("hubspot_search_rate_limit", 4), 1)
+        self.search_partitions = config.get("hubspot_search_partitions", 1)
+        self.metrics = None #RunMetrics the sync sets, API responses get counted into it
+
+    def iter_contact_search(self, search_filters:dict, id_range:tuple = None):
+        """Streams Hubspot contacts based on search_filters, one page at a time.
+        Results are walked in hs_object_id order and the search restarts from the last id seen before
+        it hits the 10k result ceiling (keyset pagination), so full enumeration works past 10k contacts.
+        Parameters:
+            search_filters: hubspot CRM API search filters: https://developers.hubspot.com/docs/guides/api/crm/search 
+            id_range: optional (low, high) hs_object_id bounds, low exclusive and high inclusive
+        Yields:
+            List of Hubspot result objects for each page"""
+        last_id, high_id = id_range or (None, None)
+        limit = search_filters.get("limit", 100)
+        while True:
+            request = self._keyset_request(search_filters, last_id, high_id)
+            after = None
+            while True:
+                if after: #set paging
+                    request["after"] = after
+                response = self._do_search(request)
+                yield response.results
+                if response.results:
+                    last_id = response.results[-1].id
+                if not (response.paging and response.paging.next):
+                    return
+                after = response.paging.next.after
+                if int(after) + limit > SEARCH_RESULT_CEILING:
+                    self.log.debug(f"Search ceiling reached, restarting after hs_object_id {last_id}")
+                    break
+
+    def iter_contact_search_partitioned(self, search_filters:dict, partitions:int):
+        """Fans the keyset search out across `partitions` hs_object_id ranges searched in parallel.
+        Pages are yielded as soon as any partition produces them, so ordering across partitions is not kept.
+        Yields:
+            List of Hubspot result objects for each page"""
+        max_id = self._max_object_id(search_filters)
+        if max_id is None:
+            return
+        edges = [max_id * i // partitions for i in range(partitions + 1)]
+        ranges = [(edges[i], edges[i + 1]) for i in range(partitions) if edges[i] < edges[i + 1]]
+        pages = queue.Queue(maxsize=len(ranges) * 2) #bounded so workers can't run far ahead of the diff
+        done = object()
+        stop = threading.Event() #set when the consumer is finished (or failed), workers stop searching
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def worker(id_range):
+            try:
+                for page in self.iter_contact_search(search_filters, id_range):
+                    if not put(page):
+                        return
+            except Exception as e:
+                put(e)
+            finally:
+                put(done)
+
+        workers = [threading.Thread(target=worker, args=(id_range,), daemon=True) for id_range in ranges]
+        for thread in workers:
+            thread.start()
+        try:
+            remaining = len(ranges)
+            while remaining:
+                item = pages.get()
+                if item is done:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            # a partition failed or the consumer stopped early: release blocked workers and wait for them
+            stop.set()
+            for thread in workers:
+                while thread.is_alive():
+                    try:
+                        while True:
+                            pages.get_nowait()
+                    except queue.Empty:
+                        pass
+                    thread.join(timeout=0.1)
 
     def contact_search(self, search_filters:dict):
         """Searches Hubspot contacts basaed on search_filters.
@@ -37,130 +148,200 @@ class HubspotClient():
             List of Hubspot result objects"""
         try:
             results = []
-            after = None
-            while True:
-                if after: #set paging
-                    search_filters["after"] = after
-                response = self.hub.crm.contacts.search_api.do_search(
-                    public_object_search_request=search_filters
-                )
-                results.extend(response.results)
-                if response.paging and response.paging.next:
-                    after = response.paging.next.after
-                else:
-                    break
+            for page in self.iter_contact_search(search_filters):
+                results.extend(page)
             self.log.info(f"Retrieved {len(results)} contacts from search")
             return results
-        except ApiException as e:
-            self.log.error(f"HubSpot API search error: {e}")
+        except contacts_sdk.ApiException:
+            pass #already logged by iter_contact_search
 
 #region ---- Employee Specific ----
+    def iter_employees(self):
+        """Streams contacts with "Dowbuilt Employee" as marketing classification or @dowbuilt.com email address.
+        Only one page of search results is held at a time.
+        Yields: Employee objects"""
+        search_request = self._employee_search_request()
+        if self.search_partitions > 1:
+            pages = self.iter_contact_search_partitioned(search_request, self.search_partitions)
+        else:
+            pages = self.iter_contact_search(search_request)
+        for page in pages:
+            for contact in page:
+                yield self._convert_employee(contact.to_dict()) #convert from hubspot object to Employee
+
     def get_employees(self):
         """Searches for contacts with "Dowbuilt Employee" as marketing classification or @dowbuilt.com email address.
         Returns: list of Employee objects """
-        search_request = {
-            "filterGroups": [{
-                "filters": [{
-                    "propertyName": "email",
-                    "operator": "CONTAINS_TOKEN",
-                    "value": "@dowbuilt.com"
-                }],
-                "filters":[{
-                    "propertyName":"marketing_classification",
-                    "operator": "EQ",
-                    "value": "Dowbuilt Employee"
-                }]
-            }],
-            "properties": ["email", "firstname", "lastname", "state", "dowbuilt_region", "marketing_classification", "company", "associatedcompanyid"],
-            "limit": 100  # Max per page
-            }
-        results = self.contact_search(search_request)
-        contacts = []
-        for contact in results:
-            contacts.append(contact.to_dict()) #convert from hubspot object to dict
-        self.hub_employees = self._convert_employees(contacts)
+        self.hub_employees = list(self.iter_employees())
+        self.log.info(f"Converted {len(self.hub_employees)} employee contacts")
+        if self.dump_json:
+            with open("hubspot.json", "w") as of:
+                json.dump({emp.email: emp.to_dict() for emp in self.hub_employees}, of, indent=2)
         return self.hub_employees
 
     def batch_delete(self, contacts:list[Employee]):
         """Takes a list of contact id's and batch archives/deletes. Batches of 100.
         Returns:
             list of emails of employees that weer archived"""
-        archived = [] #confirmed archived list
-        for chunk in self.chunk_list(contacts, 100):
+        def send(chunk):
             inputs = [{"id": emp.hub_id} for emp in chunk] # Wrap each ID in the required format
-            batch_input = BatchInputSimplePublicObjectId(inputs=inputs)
-            try:
-                response = self.hub.crm.contacts.batch_api.archive(
-                    batch_input_simple_public_object_id=batch_input
-                )
-                archived.extend(chunk)
-                self.log.info(f"{len(inputs)} Contacts successfully archived.")
-                self.log.debug(inputs)
-            except ApiException as e:
-                self.log.error(f"Error archiving contacts: {e}")
+            batch_input = contacts_sdk.BatchInputSimplePublicObjectId(inputs=inputs)
+            return self._call(self.hub.crm.contacts.batch_api, "archive", batch_input_simple_public_object_id=batch_input)
+        archived = [] #confirmed archived list
+        for result in self.executor.run(self.chunk_list(contacts, 100), send):
+            if result.ok:
+                archived.extend(result.chunk)
+                self.log.info(f"{len(result.chunk)} Contacts successfully archived.")
+                self.log.debug(result.chunk)
+            else:
+                self.log.error(f"Error archiving contacts: {result.error}")
         return archived
     
     def batch_create_employees(self, employees:list[Employee]):
         """Takes list of employee objects and batch creates in hubspot.
         Returns:
             List of user emails that were created."""
+        def send(chunk):
+            inputs = [self._create_employee_payload(emp) for emp in chunk]
+            bispobifc = contacts_sdk.BatchInputSimplePublicObjectBatchInputForCreate(inputs=inputs)
+            return self._call(self.hub.crm.contacts.batch_api, "create", batch_input_simple_public_object_batch_input_for_create=bispobifc)
         created = []
         # Batch create contacts
-        for chunk in self.chunk_list(employees, 100):
-            inputs = [self._create_employee_payload(emp) for emp in chunk]
-            bispobifc = BatchInputSimplePublicObjectBatchInputForCreate(inputs=inputs)
-            try:
-                response = self.hub.crm.contacts.batch_api.create(batch_input_simple_public_object_batch_input_for_create=bispobifc)
-                created.extend(chunk)
-                self.log.info(f"{len(inputs)} Contacts successfully created at {response.completed_at}.")
-                self.log.debug(inputs)
-            except ApiException as e:
-                self.log.error(f"Exception when calling batch_api->create: {e}")
+        for result in self.executor.run(self.chunk_list(employees, 100), send):
+            if result.ok:
+                hub_ids = {normalize_email(contact.properties.get("email")): contact.id for contact in result.response.results}
+                for emp in result.chunk:
+                    emp.hub_id = hub_ids.get(emp.email, emp.hub_id) #keep the new id for the state store
+                created.extend(result.chunk)
+                self.log.info(f"{len(result.chunk)} Contacts successfully created at {result.response.completed_at}.")
+                self.log.debug(result.chunk)
+            else:
+                self.log.error(f"Exception when calling batch_api->create: {result.error}")
         return created
     
-    def batch_update(self, employees:list[Employee]):
+    def batch_update(self, employees:list[Employee], changed:dict = None):
+        """Takes list of employee objects and batch upserts them by email.
+        Params:
+            changed: optional {email: [Employee field names]} of what differs from the HubSpot copy.
+                When given only those properties are sent, and contacts are batched by changed-property set.
+        Returns:
+            List of employees that were updated."""
+        def send(chunk):
+            inputs = [self._create_update_payload(emp, fields) for emp, fields in chunk]
+            bispobiu = contacts_sdk.BatchInputSimplePublicObjectBatchInputUpsert(inputs=inputs)
+            return self._call(self.hub.crm.contacts.batch_api, "upsert", batch_input_simple_public_object_batch_input_upsert=bispobiu)
+        groups = {} #changed-property set -> [(employee, fields)]
+        for emp in employees:
+            fields = None if changed is None else tuple(changed.get(emp.email) or PROPERTY_MAP)
+            groups.setdefault(fields, []).append((emp, fields))
+        chunks = [chunk for group in groups.values() for chunk in self.chunk_list(group, 100)]
         updated = [] 
-        for chunk in self.chunk_list(employees, 100):
-            inputs = [self._create_update_payload(emp) for emp in chunk]
-            bispobiu = BatchInputSimplePublicObjectBatchInputUpsert(inputs=inputs)
-            try:
-                api_response = self.hub.crm.contacts.batch_api.upsert(batch_input_simple_public_object_batch_input_upsert=bispobiu)
-                updated.extend(chunk)
-                self.log.info(f"{len(inputs)} Contacts successfully updated.")
-                self.log.debug(inputs)
-                return updated
-            except ApiException as e:
-                self.log.error(f"Exception when calling batch_api->create: {e}")
+        for result in self.executor.run(chunks, send):
+            if result.ok:
+                updated.extend(emp for emp, _ in result.chunk)
+                self.log.info(f"{len(result.chunk)} Contacts successfully updated.")
+                self.log.debug(result.chunk)
+            else:
+                self.log.error(f"Exception when calling batch_api->upsert: {result.error}")
         return updated
 
     #region -- Employee Specific Helper Functions --
-    def _convert_employees(self, results:list):
-        """Converts from hubspot object to Employee Object
-        Params:
-            results: list of dictionary items
-        Returns:
-            list of Employee objects"""
-        employees = []
-        for employee in results:
-            new_employee = Employee(
-                hub_id= employee.get("id"),
-                first_name = employee.get("properties", {}).get("firstname"),
-                last_name = employee.get("properties", {}).get("lastname"),
-                email = employee.get("properties", {}).get("email"),
-                state = employee.get("properties").get("state"),
-                region = employee.get("properties", {}).get("dowbuilt_region"),
-                marketing_classification = employee.get("properties", {}).get("marketing_classification"), #should be everyone in this list
-                company = employee.get("properties", {}).get("associatedcompanyid")
-            )
-            employees.append(new_employee)
-        self.log.info(f"Converted {len(employees)} employee contacts")
-        #TODO: delete
-        with open("hubspot.json", "w") as of:
-            json.dump({emp.email: asdict(emp) for emp in employees}, of, indent=2)
-        return employees
+    def _call(self, api, method:str, **kwargs):
+        """Calls api.method(**kwargs), counting and tracing the call (latency, status, size, rate limit headers) in self.metrics"""
+        start = perf_counter()
+        response, status, headers = None, None, None
+        try:
+            result = getattr(api, method)(**kwargs)
+            response = getattr(api.api_client, "last_response", None)
+            if response is not None:
+                status, headers = response.status, response.getheaders()
+            return result
+        except contacts_sdk.ApiException as e:
+            status, headers = e.status, e.headers
+            raise
+        finally:
+            if self.metrics is not None:
+                data = getattr(response, "data", None) or b""
+                sent = len(json.dumps(api.api_client.sanitize_for_serialization(kwargs))) #serialized request, failed calls included
+                self.metrics.record_api("hubspot", len(data), endpoint=f"{type(api).__name__}.{method}",
+                                        seconds=perf_counter() - start, status=status, bytes_out=sent, headers=headers)
+
+    def _do_search(self, request:dict):
+        """Runs one search request under the search rate limit, retrying 429s"""
+        attempt = 0
+        while True:
+            attempt += 1
+            self.search_bucket.acquire()
+            try:
+                return self._call(self.hub.crm.contacts.search_api, "do_search", public_object_search_request=request)
+            except contacts_sdk.ApiException as e:
+                wait = http_retry_after(e, attempt)
+                if wait is None or attempt > 5:
+                    self.log.error(f"HubSpot API search error: {e}")
+                    raise
+                self.log.warning(f"Search throttled, retrying in {wait:.1f}s")
+                self.search_bucket.pause(wait)
+
+    def _keyset_request(self, search_filters:dict, after_id = None, high_id = None) -> dict:
+        """Copies search_filters, sorted by hs_object_id and bounded to (after_id, high_id]"""
+        request = deepcopy(search_filters)
+        request.pop("after", None)
+        request["sorts"] = [{"propertyName": "hs_object_id", "direction": "ASCENDING"}]
+        bounds = []
+        if after_id is not None:
+            bounds.append({"propertyName": "hs_object_id", "operator": "GT", "value": str(after_id)})
+        if high_id is not None:
+            bounds.append({"propertyName": "hs_object_id", "operator": "LTE", "value": str(high_id)})
+        groups = request.get("filterGroups") or [{"filters": []}]
+        for group in groups: #filter groups are OR'd, so every group needs the bounds
+            group["filters"] = group.get("filters", []) + bounds
+        request["filterGroups"] = groups
+        return request
+
+    def _max_object_id(self, search_filters:dict):
+        """Returns the highest hs_object_id matching search_filters, or None if nothing matches"""
+        request = self._keyset_request(search_filters)
+        request["sorts"] = [{"propertyName": "hs_object_id", "direction": "DESCENDING"}]
+        request["limit"] = 1
+        response = self._do_search(request)
+        if not response.results:
+            return None
+        return int(response.results[0].id)
+
+    def _employee_search_request(self):
+        return {
+            "filterGroups": [{
+                "filters": [{
+                    "propertyName": "email",
+                    "operator": "CONTAINS_TOKEN",
+                    "value": "@dowbuilt.com"
+                }],
+                "filters":[{
+                    "propertyName":"marketing_classification",
+                    "operator": "EQ",
+                    "value": "Dowbuilt Employee"
+                }]
+            }],
+            "properties": ["email", "firstname", "lastname", "state", "dowbuilt_region", "marketing_classification", "company", "associatedcompanyid"],
+            "limit": 100  # Max per page
+            }
+
+    def _convert_employee(self, employee:dict) -> Employee:
+        """Converts from hubspot object (as dict) to Employee Object"""
+        properties = employee.get("properties", {})
+        return Employee(
+            hub_id= employee.get("id"),
+            first_name = properties.get("firstname"),
+            last_name = properties.get("lastname"),
+            email = normalize_email(properties.get("email")),
+            state = properties.get("state"),
+            region = properties.get("dowbuilt_region"),
+            marketing_classification = properties.get("marketing_classification"), #should be everyone in this list
+            company = properties.get("associatedcompanyid")
+        )
     
-    def _create_employee_payload(self, employee:Employee) -> SimplePublicObjectInput:
-        return SimplePublicObjectInput(
+    def _create_employee_payload(self, employee:Employee) -> "contacts_sdk.SimplePublicObjectInput":
+        return contacts_sdk.SimplePublicObjectInput(
             properties={
                 "email": employee.email,
                 "firstname": employee.first_name,
@@ -172,19 +353,25 @@ class HubspotClient():
             }
         )
     
-    def _create_update_payload(self, employee:Employee):
+    def _create_update_payload(self, employee:Employee, fields:tuple = None):
+        """Upsert input keyed by email.
+        Params:
+            fields: Employee field names to send, all properties when None"""
+        properties = {
+            "email": employee.email,
+            "firstname": employee.first_name,
+            "lastname": employee.last_name,
+            "state": employee.state,
+            "dowbuilt_region": employee.region,
+            "marketing_classification": employee.marketing_classification,
+            "associatedcompanyid": self.HB_DB_COMPANY_ID,
+        }
+        if fields is not None:
+            properties = {PROPERTY_MAP[name]: properties[PROPERTY_MAP[name]] for name in fields}
         return {
             "id":employee.email,
             "idProperty": "email",
-            "properties":{
-                "email": employee.email,
-                "firstname": employee.first_name,
-                "lastname": employee.last_name,
-                "state": employee.state,
-                "dowbuilt_region": employee.region,
-                "marketing_classification": employee.marketing_classification,
-                "associatedcompanyid": self.HB_DB_COMPANY_ID,
-            }
+            "properties": properties,
         }
     #endregion
 #endregion
@@ -199,8 +386,7 @@ class HubspotClient():
     def load_config(self, file_path = "configs/config.json"):
         """Load the config file"""
         try:
-            with open(file_path, "r") as inf:
-                return json.load(inf)
+            return load_config(file_path) #parsed once per process, shared read-only
         except Exception as e:
             self.log.error(f"ERROR: loading config file {e}")
 
@@ -0,0 +1,135 @@
+import os
+import re
+import json
+import threading
+from collections import defaultdict
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style (cumulative, +Inf last)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float("inf"))
+# Statuses the clients back off and retry on
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+def endpoint_from_url(method:str, url:str) -> str:
+    """"GET https://api.smartsheet.com/2.0/sheets/123/rows?x=1" -> "GET /sheets/{id}/rows" so calls group per endpoint"""
+    path = url.split("?", 1)[0].split("://", 1)[-1]
+    path = "/" + path.split("/", 1)[1] if "/" in path else "/"
+    path = re.sub(r"^/\d+\.\d+", "", path) #api version prefix
+    return f"{method} {_ID_SEGMENT.sub('/{id}', path)}"
+
+def rate_limit_headers(headers) -> dict:
+    """Picks the rate limit headers (X-HubSpot-RateLimit-*, Retry-After, ...) out of a response's headers"""
+    if not headers:
+        return {}
+    return {name: value for name, value in dict(headers).items() if "ratelimit" in name.lower() or name.lower() == "retry-after"}
+
+class EndpointStats():
+    """Running totals for one service/endpoint"""
+    __slots__ = ("calls", "errors", "retries", "seconds", "buckets", "bytes_in", "bytes_out", "rate_limit")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.rate_limit = {} #last value seen per rate limit header
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "seconds": round(self.seconds, 4),
+            "latency_buckets": {("+Inf" if bound == float("inf") else str(bound)): count for bound, count in zip(LATENCY_BUCKETS, self.buckets)},
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "rate_limit": self.rate_limit,
+        }
+
+class ApiTracer():
+    """Per-endpoint latency histograms, payload sizes, retries and rate limit headers for every SDK call.
+    Clients report through RunMetrics.record_api, this keeps the detail behind those totals."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = defaultdict(EndpointStats) #(service, endpoint) -> EndpointStats
+
+    def record(self, service:str, endpoint:str, seconds:float = 0.0, status:int = None, bytes_in:int = 0, bytes_out:int = 0, headers=None):
+        limits = rate_limit_headers(headers)
+        with self.lock:
+            stats = self.endpoints[(service, endpoint)]
+            stats.calls += 1
+            stats.seconds += seconds
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats.buckets[i] += 1 #cumulative, every bucket at or above the latency
+            stats.bytes_in += bytes_in
+            stats.bytes_out += bytes_out
+            if status is not None and status >= 400:
+                stats.errors += 1
+                if status in RETRY_STATUSES:
+                    stats.retries += 1
+            stats.rate_limit.update(limits)
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {f"{service} {endpoint}": stats.as_dict() for (service, endpoint), stats in sorted(self.endpoints.items())}
+
+#region ---- Reports ----
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def prometheus_text(metrics) -> str:
+    """Renders a RunMetrics (and its tracer) in the Prometheus text exposition format, for the node_exporter textfile collector"""
+    lines = [
+        "# TYPE hub_sync_run_seconds gauge",
+        f"hub_sync_run_seconds {metrics.elapsed:.3f}",
+        "# TYPE hub_sync_phase_seconds gauge",
+    ]
+    lines += [f"hub_sync_phase_seconds{_labels(phase=name)} {seconds:.3f}" for name, seconds in metrics.phases.items()]
+    lines.append("# TYPE hub_sync_records gauge")
+    lines += [f"hub_sync_records{_labels(kind=name)} {count}" for name, count in metrics.counts.items()]
+
+    endpoints = sorted(metrics.trace.endpoints.items())
+    lines.append("# TYPE hub_sync_api_request_duration_seconds histogram")
+    for (service, endpoint), stats in endpoints:
+        for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+            le = "+Inf" if bound == float("inf") else str(bound)
+            lines.append(f"hub_sync_api_request_duration_seconds_bucket{_labels(service=service, endpoint=endpoint, le=le)} {count}")
+        lines.append(f"hub_sync_api_request_duration_seconds_sum{_labels(service=service, endpoint=endpoint)} {stats.seconds:.4f}")
+        lines.append(f"hub_sync_api_request_duration_seconds_count{_labels(service=service, endpoint=endpoint)} {stats.calls}")
+    for name, attribute in (("errors", "errors"), ("retries", "retries"), ("response_bytes", "bytes_in"), ("request_bytes", "bytes_out")):
+        lines.append(f"# TYPE hub_sync_api_{name}_total counter")
+        lines += [f"hub_sync_api_{name}_total{_labels(service=service, endpoint=endpoint)} {getattr(stats, attribute)}" for (service, endpoint), stats in endpoints]
+    lines.append("# TYPE hub_sync_api_rate_limit gauge")
+    for (service, endpoint), stats in endpoints:
+        for header, value in stats.rate_limit.items():
+            try:
+                lines.append(f"hub_sync_api_rate_limit{_labels(service=service, endpoint=endpoint, header=header.lower())} {float(value)}")
+            except (TypeError, ValueError):
+                continue
+    return "\n".join(lines) + "\n"
+
+def _write_atomic(path:str, text:str):
+    """Writes through a temp file so a collector never reads half a report"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as file:
+        file.write(text)
+    os.replace(tmp, path)
+
+def write_reports(metrics, directory:str, name:str = "hub_sync") -> dict:
+    """Writes <name>.json (run metrics + per-endpoint trace) and <name>.prom into directory.
+    Returns: {"json": path, "prometheus": path}"""
+    os.makedirs(directory, exist_ok=True)
+    paths = {"json": os.path.join(directory, f"{name}.json"), "prometheus": os.path.join(directory, f"{name}.prom")}
+    report = metrics.as_dict()
+    report["endpoints"] = metrics.trace.as_dict()
+    _write_atomic(paths["json"], json.dumps(report, indent=2))
+    _write_atomic(paths["prometheus"], prometheus_text(metrics))
+    return paths
+#endregion
@@ -1,15 +1,9 @@
 from cryptography.fernet import Fernet
 import os
-import sys
 import json
 from typing import Union
 from configs.setup_logger import setup_logger
-
-def get_resource_path(relative_path):
-    """Resolves path to bundled or script-relative resource"""
-    if hasattr(sys, '_MEIPASS'):
-        return os.path.join(sys._MEIPASS, relative_path)
-    return os.path.join(os.path.abspath("."), relative_path)
+from configs.settings import get_resource_path, load_config, reload_config
 
 # Updated log file path (logs to same dir as .py or .exe)
 log = setup_logger(__name__)
@@ -58,6 +52,7 @@ def encrypt_to_config(secret_string: str, name: str, file_path: str = None):
         with open(file_path, 'w') as f:
             json.dump(config, f, indent=4)
             log.info(f"SUCCESS: Stored keys in {file_path}")
+        reload_config(file_path)
     except Exception as e:
         log.error(f"ERROR writing to config: {e}")
 
@@ -71,8 +66,7 @@ def decrypt_from_config(name: str, file_path: str = None):
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"Config file not found at {file_path}")
 
-    with open(file_path, 'r') as f:
-        config = json.load(f)
+    config = load_config(file_path)
 
     key = config.get(key_name)
     stoken = config.get(stoken_name)
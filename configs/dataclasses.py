@@ -1,6 +1,13 @@
-from dataclasses import dataclass
+import sys
+import hashlib
+from dataclasses import dataclass, field, fields
 
-@dataclass
+# Fields that make up an employee's content, hub_id is just where they live in HubSpot
+CONTENT_FIELDS = ("first_name", "last_name", "email", "state", "region", "marketing_classification", "company")
+# Low-cardinality fields, interned so both rosters share one string object per value
+INTERNED_FIELDS = ("state", "region", "marketing_classification", "company")
+
+@dataclass(slots=True, eq=False)
 class Employee:
     first_name:str
     last_name:str
@@ -10,6 +17,35 @@ class Employee:
     marketing_classification:str
     company:str
     hub_id:int = None
+    _fingerprint:int = field(default=None, init=False, repr=False, compare=False) #cache behind fingerprint, not data
+
+    def __post_init__(self):
+        for name in INTERNED_FIELDS:
+            value = getattr(self, name)
+            if type(value) is str:
+                setattr(self, name, sys.intern(value))
+
+    @property
+    def fingerprint(self) -> int:
+        """Stable 64-bit digest of the content fields (hub_id excluded), same value across runs.
+        Cached on first use, so content fields should not be changed after that."""
+        if self._fingerprint is None:
+            content = "\x1f".join(str(getattr(self, name)) for name in CONTENT_FIELDS)
+            self._fingerprint = int.from_bytes(hashlib.blake2b(content.encode(), digest_size=8).digest(), "big", signed=True)
+        return self._fingerprint
+
+    def to_dict(self) -> dict:
+        """dataclasses.asdict without the cached fingerprint, for JSON dumps"""
+        return {f.name: getattr(self, f.name) for f in fields(self) if f.name != "_fingerprint"}
 
+    def changed_fields(self, other) -> tuple:
+        """Content fields whose values differ from `other`"""
+        return tuple(name for name in CONTENT_FIELDS if getattr(self, name) != getattr(other, name))
 
+    def __eq__(self, other):
+        if not isinstance(other, Employee):
+            return NotImplemented
+        return self.fingerprint == other.fingerprint
 
+    def __hash__(self):
+        return self.fingerprint
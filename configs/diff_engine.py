@@ -0,0 +1,70 @@
+from __future__ import annotations
+from operator import attrgetter
+from dataclasses import dataclass
+from configs.dataclasses import Employee, CONTENT_FIELDS
+from configs.lazy_import import lazy_import
+pd = lazy_import("pandas")
+
+# Fields compared between the two rosters, email is the join key
+COMPARE_FIELDS = tuple(name for name in CONTENT_FIELDS if name != "email")
+EMPLOYEE_COLUMNS = list(CONTENT_FIELDS) + ["hub_id"]
+
+def normalize_email(email):
+    """Lowercases and strips an email, both rosters go through this so case/whitespace never cause updates"""
+    return email.strip().lower() if isinstance(email, str) else email
+
+def normalize_email_series(emails:pd.Series) -> pd.Series:
+    """Vectorized normalize_email"""
+    return emails.astype(object).str.strip().str.lower()
+
+@dataclass
+class DiffResult:
+    """Output of columnar_diff. Frames have Employee field columns (+ hub_id where known).
+    `changed` is a bool mask with one column per compared field, index aligned with `update`."""
+    create:pd.DataFrame
+    update:pd.DataFrame
+    delete:pd.DataFrame
+    unchanged:pd.DataFrame
+    changed:pd.DataFrame
+
+def employees_to_frame(employees) -> pd.DataFrame:
+    """Turns an iterable of Employee objects (list or stream) into a DataFrame"""
+    getter = attrgetter(*EMPLOYEE_COLUMNS)
+    return pd.DataFrame([getter(emp) for emp in employees], columns=EMPLOYEE_COLUMNS)
+
+def frame_to_employees(frame:pd.DataFrame) -> list[Employee]:
+    """Turns a diff frame back into Employee objects for the write phase"""
+    frame = frame.reindex(columns=EMPLOYEE_COLUMNS).astype(object)
+    frame = frame.where(frame.notna(), None)
+    return [Employee(*values) for values in frame.itertuples(index=False, name=None)]
+
+def columnar_diff(bamboo:pd.DataFrame, hubspot:pd.DataFrame) -> DiffResult:
+    """Outer-joins the Bamboo and HubSpot rosters on normalized email and buckets them.
+    Params:
+        bamboo: DataFrame with the Employee content fields
+        hubspot: DataFrame with the Employee content fields and hub_id
+    Returns: DiffResult"""
+    bamboo = bamboo.assign(email=normalize_email_series(bamboo["email"])).drop_duplicates("email", keep="last")
+    hubspot = hubspot.assign(email=normalize_email_series(hubspot["email"])).drop_duplicates("email", keep="first")
+    hub_columns = {name: f"{name}_hub" for name in COMPARE_FIELDS}
+    merged = bamboo.drop(columns="hub_id", errors="ignore").merge(
+        hubspot.rename(columns=hub_columns), on="email", how="outer", indicator=True
+    )
+    side = merged.pop("_merge")
+    both = (side == "both").to_numpy()
+
+    changed = pd.DataFrame({
+        name: ((merged[name] != merged[hub_name]) & ~(merged[name].isna() & merged[hub_name].isna())).to_numpy()
+        for name, hub_name in hub_columns.items()
+    }, index=merged.index)
+    any_changed = changed.to_numpy().any(axis=1)
+
+    bamboo_view = merged[EMPLOYEE_COLUMNS]
+    hub_view = merged[["email", "hub_id"] + list(hub_columns.values())].rename(columns={v: k for k, v in hub_columns.items()})
+    return DiffResult(
+        create=bamboo_view[(side == "left_only").to_numpy()].drop(columns="hub_id"),
+        update=bamboo_view[both & any_changed],
+        delete=hub_view[(side == "right_only").to_numpy()].reindex(columns=EMPLOYEE_COLUMNS),
+        unchanged=bamboo_view[both & ~any_changed],
+        changed=changed[both & any_changed],
+    )
@@ -0,0 +1,20 @@
+import importlib
+
+class LazyModule():
+    """Stand-in for a module that is imported the first time one of its attributes is used.
+    Attributes are cached on the stand-in, so after the first use `pd.isna` costs the same as on the real module.
+    Safe to share between threads, the import itself runs under the import lock."""
+    def __init__(self, name:str):
+        self.__dict__["_name"] = name
+
+    def __getattr__(self, attr:str):
+        value = getattr(importlib.import_module(self._name), attr)
+        self.__dict__[attr] = value
+        return value
+
+    def __repr__(self):
+        return f"<lazy module {self._name}>"
+
+def lazy_import(name:str) -> LazyModule:
+    """`pd = lazy_import("pandas")` instead of `import pandas as pd` for heavy imports that aren't needed to start up"""
+    return LazyModule(name)
@@ -0,0 +1,112 @@
+import queue
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+_DONE = object() #end of a stream
+
+class _StreamError():
+    """Carries a producer's exception across the queue so the consumer raises it too"""
+    def __init__(self, error:BaseException):
+        self.error = error
+
+class Pipeline():
+    """Small dependency graph of steps run on a thread pool. A step starts as soon as every step
+    it comes after has finished and gets their results as arguments, so independent steps
+    (the Bamboo and HubSpot loads, the three HubSpot writes, ...) overlap.
+    The first step to fail stops new steps from starting and its exception is raised from run()."""
+    def __init__(self, metrics=None, max_workers:int = 8):
+        self.metrics = metrics #RunMetrics, steps with a phase are timed into it
+        self.max_workers = max_workers
+        self.steps = {} #name -> (func, after, phase)
+        self.stopped = threading.Event() #set when a step fails, streams stop waiting on each other
+
+    def step(self, name:str, func, after:tuple = (), phase:str = None):
+        """Adds a step.
+        Params:
+            func: called with the results of the `after` steps, in that order
+            after: names of steps added earlier that have to finish first
+            phase: RunMetrics phase the step is timed under"""
+        if name in self.steps:
+            raise ValueError(f"Step {name} added twice")
+        missing = [dep for dep in after if dep not in self.steps]
+        if missing: #steps can only follow earlier steps, which also keeps the graph acyclic
+            raise ValueError(f"Step {name} comes after unknown steps {missing}")
+        self.steps[name] = (func, tuple(after), phase)
+
+    def stream(self, name:str, iterable, after:tuple = (), phase:str = None, maxsize:int = 1000):
+        """Adds a step that drains iterable into a queue of at most maxsize items, the producer waits while it's full.
+        Returns: iterator over the items as they are produced, for a step that runs alongside this one.
+        The step's own result is the item count. A consumer that stops early should close() the iterator,
+        the producer stops (and closes iterable) once it's closed or another step fails, so it never blocks on a queue nobody reads"""
+        items = queue.Queue(maxsize=maxsize)
+        closed = threading.Event() #the consumer is done reading
+        def put(item) -> bool:
+            while not (closed.is_set() or self.stopped.is_set()):
+                try:
+                    items.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        def produce(*_):
+            count = 0
+            try:
+                for item in iterable:
+                    if not put(item):
+                        return count
+                    count += 1
+            except BaseException as e:
+                put(_StreamError(e))
+                raise
+            finally:
+                close = getattr(iterable, "close", None) #generators release their pages/workers
+                if close is not None:
+                    close()
+            put(_DONE)
+            return count
+        def consume():
+            try:
+                while True:
+                    try:
+                        item = items.get(timeout=0.1)
+                    except queue.Empty:
+                        if self.stopped.is_set(): #another step failed, run() raises that error
+                            return
+                        continue
+                    if item is _DONE:
+                        return
+                    if isinstance(item, _StreamError):
+                        raise item.error
+                    yield item
+            finally:
+                closed.set()
+        self.step(name, produce, after, phase)
+        return consume()
+
+    def run(self) -> dict:
+        """Runs every step.
+        Returns: {step name: result}"""
+        results = {}
+        pending = dict(self.steps)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sync") as pool:
+            while pending or running:
+                for name, (func, after, phase) in list(pending.items()):
+                    if all(dep in results for dep in after):
+                        del pending[name]
+                        running[pool.submit(self._run_step, func, [results[dep] for dep in after], phase)] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except BaseException:
+                        pending.clear() #nothing new starts, steps already running finish before the pool closes
+                        self.stopped.set()
+                        raise
+        return results
+
+    def _run_step(self, func, args:list, phase:str):
+        with (self.metrics.phase(phase) if phase and self.metrics else nullcontext()):
+            return func(*args)
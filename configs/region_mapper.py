@@ -0,0 +1,63 @@
+import re
+from collections import Counter
+from configs.setup_logger import setup_logger
+
+class RegionMapper():
+    """Compiled Bamboo location/division -> HubSpot region lookup.
+    Built once from the `regions` config ({"<region>": ["<division or location>", ...]}) into a single
+    hash index. Override rules pick which divisions get mapped by their location instead, by default
+    the "Division 10" rule, a rule other than {"division_contains": ..., "use": "location"} raises ValueError. Every value that doesn't map is counted in `unmapped` for one report per run."""
+    DEFAULT_OVERRIDES = [{"division_contains": "Division 10", "use": "location"}]
+
+    def __init__(self, regions:dict, overrides:list = None):
+        self.log = setup_logger(__name__)
+        self.index = {region: region for region in regions} #region names map to themselves first
+        for region, locations in regions.items():
+            for loc in locations:
+                self.index.setdefault(loc, region) #first matching region wins
+        rules = self.DEFAULT_OVERRIDES if overrides is None else overrides
+        invalid = [rule for rule in rules if not rule.get("division_contains") or rule.get("use", "location") != "location"]
+        if invalid: #"location" is the only supported rule, anything else would silently map by division
+            raise ValueError(f"Unsupported region_overrides rules {invalid}, each needs division_contains and use: \"location\"")
+        self.location_overrides = tuple(rule["division_contains"] for rule in rules)
+        self._override_pattern = "|".join(re.escape(token) for token in self.location_overrides)
+        self.unmapped = Counter()
+
+    def map(self, location:str, division:str) -> str:
+        """Maps a single employee's location/division to a region, "" if there's no match"""
+        use_location = isinstance(division, str) and any(token in division for token in self.location_overrides)
+        key = location if use_location else division
+        region = self.index.get(key)
+        if region is None:
+            self.unmapped[f"{'location' if use_location else 'division'}: {key}"] += 1
+            return ""
+        return region
+
+    def map_series(self, location, division):
+        """Vectorized map over whole location/division columns (pandas Series)
+        Returns: Series of regions, "" where there's no match"""
+        location, division = location.astype(object), division.astype(object)
+        if self._override_pattern:
+            use_location = division.str.contains(self._override_pattern, na=False, regex=True)
+        else:
+            use_location = division.map(lambda _: False)
+        keys = division.where(~use_location, location)
+        regions = keys.map(self.index)
+        missing = regions.isna()
+        if missing.any():
+            source = use_location[missing].map({True: "location", False: "division"})
+            self.unmapped.update((source + ": " + keys[missing].astype(str)).tolist())
+        return regions.fillna("")
+
+    def reset(self):
+        """Clears the unmapped counts, call at the start of each run"""
+        self.unmapped.clear()
+
+    def report(self) -> dict:
+        """Returns {"division: <value>" / "location: <value>": count} for everything that didn't map"""
+        return dict(self.unmapped)
+
+    def log_report(self):
+        if self.unmapped:
+            total = sum(self.unmapped.values())
+            self.log.warning(f"{total} employees have no region mapping, add these to the regions config: {self.report()}")
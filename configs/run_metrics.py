@@ -0,0 +1,97 @@
+import threading
+from time import perf_counter
+from collections import Counter
+from contextlib import contextmanager
+from configs.api_trace import ApiTracer
+
+class RunMetrics():
+    """Numbers for one sync run, collected from what the run already has in memory.
+    counts: record counts (bamboo, hubspot, create/update/delete/unchanged, created/updated/deleted)
+    phases: wall time per phase in seconds, a nested phase's time is not counted again in the phase around it.
+        Phases on different threads (pipeline steps) overlap, so they can add up to more than elapsed
+    api_calls / api_bytes: per service, recorded by the clients as responses come back
+    trace: per-endpoint detail behind api_calls (latency histogram, payload sizes, retries, rate limit headers)"""
+    def __init__(self):
+        self.started = perf_counter()
+        self.counts = Counter()
+        self.phases = {}
+        self.api_calls = Counter()
+        self.api_bytes = Counter()
+        self.trace = ApiTracer()
+        self.lock = threading.Lock()
+        self._local = threading.local() #per thread: time spent in child phases, one entry per open phase
+
+    @contextmanager
+    def phase(self, name:str):
+        """Times the block under `name` (adds up if the phase runs more than once)"""
+        stack = self._nested
+        start = perf_counter()
+        stack.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            nested = stack.pop()
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed - nested
+            if stack:
+                stack[-1] += elapsed
+
+    @property
+    def _nested(self) -> list:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def timed_iter(self, name:str, iterable, count:str = None):
+        """Yields from iterable, time spent producing items goes to phase `name` and items are counted in counts[count or name].
+        Used for the HubSpot stream, which is loaded while the diff consumes it"""
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            self.counts[count or name] += 1
+            yield item
+
+    def record_api(self, service:str, nbytes:int = 0, endpoint:str = None, seconds:float = 0.0, status:int = None, bytes_out:int = 0, headers=None):
+        """One API response from `service`, called from client threads.
+        Params:
+            nbytes: response size
+            endpoint: e.g. "GET /sheets/{id}", when given the call is traced with the rest of the params"""
+        with self.lock:
+            self.api_calls[service] += 1
+            self.api_bytes[service] += nbytes
+        if endpoint is not None:
+            self.trace.record(service, endpoint, seconds, status, nbytes, bytes_out, headers)
+
+    @property
+    def elapsed(self) -> float:
+        return perf_counter() - self.started
+
+    @property
+    def hubspot_total(self) -> int:
+        """HubSpot employee contacts after this run's writes"""
+        return self.counts["hubspot"] + self.counts["created"] - self.counts["deleted"]
+
+    def as_dict(self) -> dict:
+        return {
+            "elapsed": round(self.elapsed, 3),
+            "counts": dict(self.counts),
+            "phases": {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            "api_calls": dict(self.api_calls),
+            "api_bytes": dict(self.api_bytes),
+        }
+
+    def summary(self) -> str:
+        """One line for the log and the Execution Metadata row"""
+        counts = self.counts
+        phases = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in self.phases.items())
+        api = ", ".join(f"{service} {calls} calls/{self.api_bytes[service] / 1024:.0f} KB" for service, calls in self.api_calls.items())
+        return (
+            f"{self.hubspot_total} hubspot employees synced from {counts['bamboo']} Bamboo employees. "
+            f"{counts['created']} created, {counts['updated']} updated, {counts['deleted']} deleted, {counts['unchanged']} unchanged. "
+            f"{self.elapsed:.1f}s ({phases}). API: {api or 'none'}"
+        )
@@ -0,0 +1,33 @@
+import os
+import sys
+import json
+import threading
+from types import MappingProxyType
+
+CONFIG_PATH = "configs/config.json"
+_lock = threading.Lock()
+_configs = {} #absolute path -> read-only config
+
+def get_resource_path(relative_path):
+    """Resolves path to bundled or script-relative resource"""
+    if hasattr(sys, '_MEIPASS'):
+        return os.path.join(sys._MEIPASS, relative_path)
+    return os.path.join(os.path.abspath("."), relative_path)
+
+def load_config(file_path:str = None) -> MappingProxyType:
+    """configs/config.json, parsed once per process and shared read-only by every module that reads it.
+    Params:
+        file_path: another config file, defaults to configs/config.json
+    Returns: read-only mapping of the top level keys"""
+    path = os.path.abspath(file_path or get_resource_path(CONFIG_PATH))
+    with _lock:
+        config = _configs.get(path)
+        if config is None:
+            with open(path, "r") as inf:
+                config = _configs[path] = MappingProxyType(json.load(inf))
+        return config
+
+def reload_config(file_path:str = None):
+    """Drops the parsed copy of a config file after it was written (crypter.encrypt_to_config)"""
+    with _lock:
+        _configs.pop(os.path.abspath(file_path or get_resource_path(CONFIG_PATH)), None)
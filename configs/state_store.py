@@ -0,0 +1,98 @@
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from configs.setup_logger import setup_logger
+from configs.dataclasses import Employee, CONTENT_FIELDS
+
+class SyncStateStore():
+    """Local SQLite record of what the last sync wrote, so the next run can skip unchanged work.
+    Keeps per email: the Employee content that was synced, its fingerprint and HubSpot hub_id.
+    Control sheet row ids are kept separately per (lowercased) Email column value, which also covers
+    the "Execution Metadata:" row, and so are the log rows Smartsheet rejected, which the next run writes again.
+    The connection is shared by the pipeline's threads, every read and write goes through self.lock."""
+    def __init__(self, file_path:str = "configs/sync_state.db"):
+        self.log = setup_logger(__name__)
+        self.file_path = file_path
+        self.conn = sqlite3.connect(file_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        columns = ", ".join(f"{name} TEXT" for name in CONTENT_FIELDS if name != "email")
+        with self.conn:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS employees (email TEXT PRIMARY KEY, {columns}, hub_id TEXT, fingerprint INTEGER, synced_at TEXT)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS control_rows (email TEXT PRIMARY KEY, row_id INTEGER)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS log_retries (email TEXT PRIMARY KEY, {columns}, hub_id TEXT, action TEXT)")
+
+#region ---- Employees ----
+    def load_employees(self) -> dict:
+        """Returns: {email: (Employee as last synced, fingerprint)}"""
+        with self.lock:
+            rows = self.conn.execute(f"SELECT {', '.join(CONTENT_FIELDS)}, hub_id, fingerprint FROM employees").fetchall()
+        return {row[2]: (Employee(*row[:-1]), row[-1]) for row in rows}
+
+    def save_employees(self, employees:list[Employee], stale:set = frozenset()):
+        """Upserts synced employees.
+        Params:
+            stale: emails whose HubSpot write failed, stored with a blank fingerprint so the next run retries them"""
+        now = datetime.now().isoformat(timespec="seconds")
+        rows = [
+            tuple(getattr(emp, name) for name in CONTENT_FIELDS) + (emp.hub_id, None if emp.email in stale else emp.fingerprint, now)
+            for emp in employees
+        ]
+        placeholders = ", ".join("?" * (len(CONTENT_FIELDS) + 3))
+        with self.lock, self.conn:
+            self.conn.executemany(f"INSERT OR REPLACE INTO employees ({', '.join(CONTENT_FIELDS)}, hub_id, fingerprint, synced_at) VALUES ({placeholders})", rows)
+
+    def delete_employees(self, emails):
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM employees WHERE email = ?", ((email,) for email in emails))
+
+    def replace_employees(self, employees:list[Employee], stale:set = frozenset()):
+        """Full reconcile: the store ends up holding exactly `employees`"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM employees")
+        self.save_employees(employees, stale)
+#endregion
+
+#region ---- Control sheet rows ----
+    def load_row_ids(self) -> dict:
+        """Returns: {lowercased Email column value: row id}"""
+        with self.lock:
+            return dict(self.conn.execute("SELECT email, row_id FROM control_rows").fetchall())
+
+    def save_row_ids(self, row_ids:dict, replace:bool = False):
+        with self.lock, self.conn:
+            if replace:
+                self.conn.execute("DELETE FROM control_rows")
+            self.conn.executemany("INSERT OR REPLACE INTO control_rows (email, row_id) VALUES (?, ?)", row_ids.items())
+
+    def load_log_retries(self) -> dict:
+        """Returns: {lowercased email: (Employee, action)} for log rows that failed to write"""
+        with self.lock:
+            rows = self.conn.execute(f"SELECT email, {', '.join(CONTENT_FIELDS)}, hub_id, action FROM log_retries").fetchall()
+        return {row[0]: (Employee(*row[1:-1]), row[-1]) for row in rows}
+
+    def save_log_retries(self, retries:dict):
+        """Replaces the pending log rows with `retries` ({lowercased email: (Employee, action)}), empty once they all went through"""
+        rows = [(email,) + tuple(getattr(emp, name) for name in CONTENT_FIELDS) + (emp.hub_id, action) for email, (emp, action) in retries.items()]
+        placeholders = ", ".join("?" * (len(CONTENT_FIELDS) + 3))
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM log_retries")
+            self.conn.executemany(f"INSERT INTO log_retries (email, {', '.join(CONTENT_FIELDS)}, hub_id, action) VALUES ({placeholders})", rows)
+#endregion
+
+#region ---- Reconcile schedule ----
+    def needs_full_reconcile(self, interval_hours:float) -> bool:
+        """True if there's never been a full run or the last one is older than interval_hours"""
+        with self.lock:
+            last = self.conn.execute("SELECT value FROM meta WHERE key = 'last_full_reconcile'").fetchone()
+        if last is None:
+            return True
+        return datetime.now() - datetime.fromisoformat(last[0]) >= timedelta(hours=interval_hours)
+
+    def mark_full_reconcile(self):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_full_reconcile', ?)", (datetime.now().isoformat(timespec="seconds"),))
+#endregion
+
+    def close(self):
+        self.conn.close()
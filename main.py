@@ -1,12 +1,31 @@
+import os
 import json
-from dataclasses import dataclass, asdict
+import pstats
+import cProfile
+import signal
+import argparse
+import threading
+import tracemalloc
+from time import monotonic
+from dataclasses import dataclass
 from configs.setup_logger import setup_logger
+from configs.settings import load_config
+from configs.lazy_import import lazy_import
 from configs.dataclasses import Employee
+from configs.region_mapper import RegionMapper
+from configs.state_store import SyncStateStore
+from configs.run_metrics import RunMetrics
+from configs.pipeline import Pipeline
+from configs.api_trace import write_reports
+from configs.diff_engine import columnar_diff, employees_to_frame, frame_to_employees, normalize_email_series
 from clients.grid import grid
-import configs.crypter as crypter
+from clients.client_factory import credential
 from clients.hub_cli import HubspotClient
-import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
+pd = lazy_import("pandas") #with grid's pandas/smartsheet, first used by the Bamboo load, so importing main stays quick
+
+# Bamboo export columns _df_to_empl_obj reads, the rest of the sheet is never downloaded
+BAMBOO_COLUMNS = ["preferredName", "firstName", "lastName", "emailAsText", "location", "division"]
 
 class HubspotEmployeeSync():
     def __init__(self):
@@ -18,87 +37,312 @@ class HubspotEmployeeSync():
         self.BAMBOO_DATA_SS_ID = config.get("bamboo_data_ss_id")
         self.HUBSPOT_SS_ID = config.get("hubspot_ss_id")
         self.regions = config.get("regions")
+        self.region_mapper = RegionMapper(self.regions, config.get("region_overrides"))
         self.HB_DB_COMPANY_ID = config.get("HB_DB_COMPANY_ID")
+        self.dump_json = config.get("dump_json", False) #write bamboo.json for debugging
+        self.diff_engine = config.get("diff_engine", "python") #"python" or "columnar"
+        # optional local state so runs between full reconciles skip the HubSpot search and sheet fetch
+        state_path = config.get("state_store_path")
+        self.state_store = SyncStateStore(state_path) if state_path else None
+        self.full_reconcile_hours = config.get("full_reconcile_hours", 24)
+        # log sheet compaction, runs on full runs (when the log sheet is fetched anyway)
+        self.log_compaction = config.get("log_compaction", False)
+        self.log_keep_metadata_rows = config.get("log_keep_metadata_rows", 1)
+        self.log_retention_days = config.get("log_retention_days") #archive "Deleted" rows older than this, None keeps them
+        self.log_archive_ss_id = config.get("log_archive_ss_id")
+        self.log_archive_path = config.get("log_archive_path", "configs/log_archive.jsonl.gz")
+        self.metrics_report_dir = config.get("metrics_report_dir") #JSON + Prometheus textfile report per run, None skips it
+        # watch mode (--watch), resident process that syncs when the Bamboo sheet changes
+        self.watch_interval = config.get("watch_interval_seconds", 60) #between Bamboo sheet version polls
+        self.watch_debounce = config.get("watch_debounce_seconds", 30) #version has to stay put this long before syncing
+        self.watch_max_delay = config.get("watch_max_delay_seconds", 300) #sync anyway once a change has waited this long
+        self.watch_resync_hours = config.get("watch_resync_hours", 24) #sync without a Bamboo change, picks up edits made in HubSpot
 
         #Tokens
-        self.ss_token = crypter.decrypt_from_config("ss_automation_token")
+        self.ss_token = credential("ss_automation_token")
         grid.token = self.ss_token
 
         #Clients
         self.hub_client = HubspotClient()
+        self.bamboo_sheet = None #grid kept between syncs, see get_bamboo_data
+        self.metrics = RunMetrics() #replaced at the start of every sync
 
 
 #region ---- Main functions ----
     def sync(self):
-        bamboo_map = self.get_bamboo_data()
-        hub_map = self.hub_client.get_employees()
-
-        create, update, delete, unchanged = self.compare_employee_lists(hub_map, bamboo_map)
-        created = self.hub_client.batch_create_employees(create)
-        updated = self.hub_client.batch_update(update)
-        deleted = self.hub_client.batch_delete(delete)
-        self.post_to_ss(created, updated, deleted, unchanged)
+        """Runs the sync as a pipeline: the Bamboo and HubSpot loads run concurrently, the diff starts once Bamboo is in
+        (and consumes HubSpot pages as they arrive), the three HubSpot writes run concurrently since they touch disjoint
+        contacts, and on full runs the log sheet is fetched while they are in flight."""
+        # fresh numbers per run, the clients report their API calls to it
+        self.metrics = metrics = RunMetrics()
+        self.hub_client.metrics = metrics
+        grid.metrics = metrics
+        full = self.state_store is None or self.state_store.needs_full_reconcile(self.full_reconcile_hours)
+        pipeline = Pipeline(metrics)
+
+        pipeline.step("bamboo", self.get_bamboo_data, phase="bamboo_load")
+        if full:
+            hub_stream = pipeline.stream("hubspot", metrics.timed_iter("hubspot_load", self.hub_client.iter_employees(), count="hubspot"))
+            # started after the Bamboo load so it doesn't compete with it, it only has to be ready by sheet_post
+            pipeline.step("log_sheet", lambda _: self.fetch_log_sheet(), after=("bamboo",), phase="log_sheet_load")
+
+        def diff(bamboo_map):
+            metrics.counts["bamboo"] = len(bamboo_map)
+            if not full:
+                result = self.compare_with_state(bamboo_map)
+            elif self.diff_engine == "columnar":
+                result = self.compare_employee_frames(hub_stream, self.bamboo_frame)
+            else:
+                result = self.compare_employee_lists(hub_stream, bamboo_map)
+            metrics.counts.update(create=len(result[0]), update=len(result[1]), delete=len(result[2]), unchanged=len(result[3]))
+            return result
+        pipeline.step("diff", diff, after=("bamboo",), phase="diff")
+
+        def write(count, send): #HubSpot write step, counts what went through before sheet_post reads the counts
+            def step(result):
+                done = send(result)
+                metrics.counts[count] = len(done)
+                return done
+            return step
+        pipeline.step("hubspot_create", write("created", lambda result: self.hub_client.batch_create_employees(result[0])), after=("diff",), phase="hubspot_create")
+        pipeline.step("hubspot_update", write("updated", lambda result: self.hub_client.batch_update(result[1], changed=self.changed_fields)), after=("diff",), phase="hubspot_update")
+        pipeline.step("hubspot_delete", write("deleted", lambda result: self.hub_client.batch_delete(result[2])), after=("diff",), phase="hubspot_delete")
+        writes = ("hubspot_create", "hubspot_update", "hubspot_delete")
+
+        if full:
+            post = lambda result, created, updated, deleted, sheet: self.post_to_ss(created, updated, deleted, result[3], sheet=sheet,
+                                                                                   retries=self.state_store.load_log_retries() if self.state_store else None)
+            pipeline.step("sheet_post", post, after=("diff",) + writes + ("log_sheet",), phase="sheet_post")
+        else: #unchanged employees were logged on an earlier run, row ids come from the store
+            post = lambda created, updated, deleted: self.post_to_ss(created, updated, deleted, [], row_ids=self.state_store.load_row_ids(),
+                                                                     retries=self.state_store.load_log_retries())
+            pipeline.step("sheet_post", post, after=writes, phase="sheet_post")
+        if self.state_store:
+            save = lambda result, created, updated, deleted: self.record_state(full, created, result[1], updated, result[2], deleted, result[3])
+            pipeline.step("state_save", save, after=("diff",) + writes, phase="state_save")
+        pipeline.run()
         #TODO: verify they the same with self.verify()
+        self.log.info(metrics.summary())
+        if self.metrics_report_dir:
+            paths = write_reports(metrics, self.metrics_report_dir)
+            self.log.info(f"Metrics report written to {paths['json']} and {paths['prometheus']}")
         self.log.info("SYNC COMPLETE")
 
+    def watch(self, interval:float = None, debounce:float = None, stop:threading.Event = None):
+        """Resident mode: polls the Bamboo sheet's version (one cheap call) and syncs when it changes, with the
+        clients, config and sheet cache staying warm between syncs. Syncs once at startup.
+        Params:
+            interval: seconds between version polls, defaults to watch_interval_seconds
+            debounce: seconds the version has to stay put before syncing, so an export written in several batches
+                triggers one sync. A change is synced after watch_max_delay_seconds even if the sheet keeps changing
+            stop: Event that ends the loop, the sync in progress finishes first (main() sets it on SIGTERM/SIGINT)"""
+        interval = interval or self.watch_interval
+        debounce = self.watch_debounce if debounce is None else debounce
+        stop = stop or threading.Event()
+        if self.bamboo_sheet is None:
+            self.bamboo_sheet = grid(self.BAMBOO_DATA_SS_ID)
+        synced_version = None #version the last successful sync read
+        last_sync = None
+        seen_version, seen_at = None, None #latest polled version and when it first showed up
+        changed_at = None #when the sheet first differed from synced_version
+        failures, retry_at = 0, 0.0
+        self.log.info(f"Watching Bamboo sheet {self.BAMBOO_DATA_SS_ID}: polling every {interval}s, {debounce}s debounce")
+        while not stop.is_set():
+            now = monotonic()
+            try:
+                version = self.bamboo_sheet.get_sheet_version()
+            except Exception as e:
+                self.log.warning(f"Polling the Bamboo sheet version failed: {e}")
+                stop.wait(interval)
+                continue
+            if version != seen_version:
+                seen_version, seen_at = version, now
+            changed = version != synced_version
+            if changed and changed_at is None:
+                changed_at = now
+            settled = changed and (now - seen_at >= debounce or now - changed_at >= self.watch_max_delay)
+            stale = last_sync is None or now - last_sync >= self.watch_resync_hours * 3600
+            if (settled or stale) and now >= retry_at:
+                self.log.info(f"Bamboo sheet version {synced_version} -> {version}, syncing" if changed else "No Bamboo changes since the last resync, syncing")
+                try:
+                    self.sync()
+                except Exception:
+                    failures += 1
+                    wait = min(interval * 2 ** failures, 3600)
+                    retry_at = monotonic() + wait
+                    self.log.exception(f"Sync failed ({failures} in a row), retrying in {wait:.0f}s")
+                else:
+                    failures, retry_at = 0, 0.0
+                    synced_version = self.bamboo_sheet.grid_version #what the sync read, a change made during it is picked up next poll
+                    last_sync, changed_at = monotonic(), None
+                continue
+            stop.wait(min(interval, debounce or interval) if changed else interval) #poll faster while a change settles
+        self.log.info("Watch stopped")
+
+    def compare_with_state(self, bamboo):
+        """Incremental diff against the local state store instead of a HubSpot search.
+        Only employees whose fingerprint changed since the last sync are updated, hub_ids come from the store.
+        Returns: create, update, delete, unchanged lists"""
+        state = self.state_store.load_employees()
+        self.metrics.counts["hubspot"] = sum(1 for synced, _ in state.values() if synced.hub_id is not None) #contacts as of the last sync
+        create, update, unchanged = [], [], []
+        self.changed_fields = {}
+        for emp in bamboo:
+            synced, fingerprint = state.pop(emp.email, (None, None))
+            if synced is None or synced.hub_id is None:
+                create.append(emp)
+                continue
+            emp.hub_id = synced.hub_id
+            if emp.fingerprint != fingerprint:
+                update.append(emp)
+                self.changed_fields[emp.email] = emp.changed_fields(synced)
+            else:
+                unchanged.append(emp)
+        delete = [synced for synced, _ in state.values() if synced.hub_id is not None] #left over = no longer in bamboo
+        self.log.info(f"Incremental diff: {len(create)} to add, {len(update)} to update, {len(delete)} to remove, {len(unchanged)} unchanged")
+        return create, update, delete, unchanged
+
+    def record_state(self, full, created, update, updated, delete, deleted, unchanged):
+        """Writes what this run synced to the state store.
+        Failed updates are kept with a blank fingerprint so they are retried, failed creates/deletes are
+        left out/kept so the next incremental run picks them up again."""
+        deleted_emails = {emp.email for emp in deleted}
+        updated_emails = {emp.email for emp in updated}
+        stale = {emp.email for emp in update if emp.email not in updated_emails}
+        if full:
+            failed_deletes = [emp for emp in delete if emp.email not in deleted_emails] #still in HubSpot, the next run's leftovers
+            synced = [emp for emp in created if emp.hub_id is not None] + list(update) + list(unchanged) + failed_deletes
+            self.state_store.replace_employees(synced, stale)
+            self.state_store.mark_full_reconcile()
+        else:
+            synced = [emp for emp in created if emp.hub_id is not None] + list(updated) + [emp for emp in update if emp.email in stale]
+            self.state_store.save_employees(synced, stale)
+        self.state_store.delete_employees(emp.email for emp in deleted)
+        self.log.info(f"Saved sync state for {len(synced)} employees ({'full reconcile' if full else 'incremental'})")
+
     def compare_employee_lists(self, hubspot, bamboo):
+        """Compares HubSpot contacts to Bamboo employees by email.
+        Params:
+            hubspot: any iterable of Employee objects, e.g. the hub_client.iter_employees() stream
+            bamboo: list of Employee objects
+        Returns: create, update, delete, unchanged lists"""
         #map by email
-        bamboo_map, hubspot_map = self._map_employees(bamboo), self._map_employees(hubspot)
-        create, update, delete, unchanged = [], [], hubspot_map, []
-        for email, bamb_contact in bamboo_map.items():
-            hub_contact = hubspot_map.get(email, None)
-            if hub_contact:
-                self.log.debug(f"{email} exists") #if they exist check for updates
-                bamb_contact.hub_id = hub_contact.hub_id #add the hubspot id, 
-                if hub_contact != bamb_contact: 
-                    update.append(bamb_contact) #add the employee object to update
-                else:
-                    self.log.debug(f"No updates for: {email}")
-                    unchanged.append(bamb_contact)
-                del delete[email] # the only people left at the end will be people to remove, theoretically
-            elif hub_contact is None: #they don't exist in hubspot, they need to be added
-                create.append(bamb_contact)
-        delete = list(delete.values()) #turn back into list
+        bamboo_map = self._map_employees(bamboo)
+        create, update, delete, unchanged = [], [], [], []
+        self.changed_fields = {} #email -> fields that differ from the hubspot copy
+        seen = set() #hubspot emails already handled
+        for hub_contact in hubspot:
+            email = hub_contact.email
+            if email in seen:
+                self.log.debug(f"Duplicate hubspot contact for {email}, skipping")
+                continue
+            seen.add(email)
+            bamb_contact = bamboo_map.get(email, None)
+            if bamb_contact is None: # not in bamboo anymore, they need to be removed
+                delete.append(hub_contact)
+                continue
+            self.log.debug(f"{email} exists") #if they exist check for updates
+            bamb_contact.hub_id = hub_contact.hub_id #add the hubspot id, 
+            if hub_contact != bamb_contact: #fingerprint compare, hub_id not included
+                update.append(bamb_contact) #add the employee object to update
+                self.changed_fields[email] = bamb_contact.changed_fields(hub_contact)
+            else:
+                self.log.debug(f"No updates for: {email}")
+                unchanged.append(bamb_contact)
+        create = [emp for email, emp in bamboo_map.items() if email not in seen] #they don't exist in hubspot, they need to be added
         self.log.info(f"Found {len(create)} employees to add: \n{create}\n")
         self.log.info(f"Found {len(update)} employees to update: \n{update}\n")
         self.log.info(f"Found {len(delete)} emplopyees to remove: \n{delete}\n")
         self.log.info(f"Found {len(unchanged)} employees with no changes \n{unchanged}")
         return create, update, delete, unchanged
 
-    def post_to_ss(self, created, updated, deleted, unchanged):
-        """Syncs updates to Hubspot Log sheet"""
-        sheet = grid(self.HUBSPOT_SS_ID)
-        sheet.fetch_content()
-        df = sheet.df
+    def compare_employee_frames(self, hubspot, bamboo_frame):
+        """Columnar alternative to compare_employee_lists, outer-joins both rosters on normalized email.
+        Params:
+            hubspot: any iterable of Employee objects
+            bamboo_frame: DataFrame from _bamboo_frame
+        Returns: create, update, delete, unchanged lists"""
+        result = columnar_diff(bamboo_frame, employees_to_frame(hubspot))
+        mask_columns = result.changed.columns
+        self.changed_fields = { #email -> fields that differ from the hubspot copy
+            email: tuple(mask_columns[flags])
+            for email, flags in zip(result.update["email"], result.changed.to_numpy())
+        }
+        create, update = frame_to_employees(result.create), frame_to_employees(result.update)
+        delete, unchanged = frame_to_employees(result.delete), frame_to_employees(result.unchanged)
+        self.log.info(f"Found {len(create)} to add, {len(update)} to update, {len(delete)} to remove, {len(unchanged)} with no changes")
+        self.log.info(f"Changed field counts: {result.changed.sum().to_dict()}")
+        self.log.debug(f"Add: {create}\nUpdate: {update}\nRemove: {delete}")
+        return create, update, delete, unchanged
+
+    def post_to_ss(self, created, updated, deleted, unchanged, row_ids=None, sheet:grid = None, retries:dict = None):
+        """Syncs updates to Hubspot Log sheet
+        Params:
+            row_ids: known {lowercased Email: row id} for the log sheet (from the state store), skips fetching the sheet
+            sheet: the log sheet grid when it was already fetched (fetch_log_sheet)
+            retries: {lowercased email: (Employee, action)} log rows an earlier run failed to write (state store), written again
+                unless this run has a newer row for them. The rows that fail this time replace them in the store"""
+        sheet = sheet or grid(self.HUBSPOT_SS_ID)
+        fetched = not row_ids
+        if fetched:
+            sheet.ensure_content()
+            row_ids = dict(sheet.row_index("Email", key=str.lower)) # copy, posted rows get added below
+            if self.log_compaction:
+                self.compact_log_sheet(sheet, row_ids)
         now = datetime.now().strftime("%Y-%m-%d %H:%M")
-        email_lc_list = df["Email"].str.lower().tolist()
 
         self.log.info(f"Created: {created} \n Updated: {updated} \n Deleted {deleted}")
 
-        post_new = [self.build_row(emp, "Created", now) for emp in created]
-        post_update = [self.build_row(emp, "Updated", now) for emp in updated]
-        delete_update = [self.build_row(emp, "Deleted", now, removed=True) for emp in deleted]
-        no_change_post = [self.build_row(emp, "Initial Sync", now) for emp in unchanged if emp.email not in email_lc_list]
-        all_rows = post_new + post_update + delete_update + no_change_post
-
+        # one pass: each row goes to update if its email already has a row on the sheet, else it's posted as new
         new = []
         update = []
         update.append(self.execution_metadata()) #add metadata row information
-        for row in all_rows:
-            if row.get("Email", "").lower() in email_lc_list:
-                update.append(row)
-            else:
-                new.append(row)
+        rows = [(emp, action) for employees, action in ((created, "Created"), (updated, "Updated"), (deleted, "Deleted")) for emp in employees]
+        rows += [(emp, "Initial Sync") for emp in unchanged if (emp.email or "").lower() not in row_ids]
+        current = {(emp.email or "").lower() for emp, _ in rows}
+        rows += [(emp, action) for email, (emp, action) in (retries or {}).items() if email not in current] #this run's row is newer
+        written = {} #lowercased email -> (employee, action), what gets stored if its row is rejected
+        for emp, action in rows:
+            email = (emp.email or "").lower()
+            written[email] = (emp, action)
+            (update if email in row_ids else new).append(self.build_row(emp, action, now, removed=action == "Deleted"))
+        self.log_failed = set() #lowercased emails whose log row didn't get written
+        unposted = set() #of those, the ones that have no row on the sheet
         if update:
             self.log.info(f"Posting {len(update)} updates to Smartsheet...")
-            sheet.update_rows(update, "Email")
+            try:
+                # only differing cells are sent when the sheet was fetched, a new timestamp alone doesn't rewrite a row
+                sheet.update_rows(update, "Email", row_ids=row_ids, key=str.lower, touch_columns=("Latest Update",))
+            except Exception as e:
+                if fetched:
+                    raise
+                self.log.warning(f"Stored row ids are out of date ({e}), re-fetching the log sheet")
+                return self.post_to_ss(created, updated, deleted, unchanged, retries=retries)
+            if sheet.failed_updates and not fetched:
+                # partial success doesn't raise, rows deleted from the sheet come back as failed items instead
+                self.log.warning(f"{len(sheet.failed_updates)} stored row ids were rejected, re-fetching the log sheet")
+                return self.post_to_ss(created, updated, deleted, unchanged, retries=retries)
+            row_ids.update(sheet.posted_row_ids("Email", key=str.lower)) #unmatched rows get posted by update_rows
+            unposted |= sheet.failed_row_keys(sheet.failed_posts, "Email", key=str.lower)
+            self.log_failed |= sheet.failed_row_keys(sheet.failed_updates, "Email", key=str.lower)
         else:
             self.log.info("No updates to post")
         if new:
             self.log.info(f"Posting {len(new)} new rows to Smartsheet...")
             sheet.post_new_rows(new)
+            row_ids.update(sheet.posted_row_ids("Email", key=str.lower))
+            unposted |= sheet.failed_row_keys(sheet.failed_posts, "Email", key=str.lower)
         else:
             self.log.info("No New to post")
+        self.log_failed |= unposted
+        if self.log_failed:
+            # partial success: these rows were rejected, the next run writes them again
+            self.log.warning(f"{len(self.log_failed)} log sheet rows failed to write: {sorted(self.log_failed)}")
+            for email in unposted: #no row to update next time, it gets posted
+                row_ids.pop(email, None)
+        if self.state_store:
+            self.state_store.save_row_ids(row_ids, replace=fetched)
+            self.state_store.save_log_retries({email: written[email] for email in self.log_failed if email in written})
 
 #endregion
 
@@ -107,45 +351,49 @@ class HubspotEmployeeSync():
         """Retrieves the employee data from the "Employees_Bamboo Updated: ...." Smartsheet.
         Returns:
             List of "Employee" dataclass objects containing current employee information"""
-        sheet = grid(self.BAMBOO_DATA_SS_ID)
-        sheet.fetch_content()
+        if self.bamboo_sheet is None:
+            self.bamboo_sheet = grid(self.BAMBOO_DATA_SS_ID)
+        sheet = self.bamboo_sheet
+        sheet.fetch_content(incremental=True, columns=BAMBOO_COLUMNS) #export sheet usually hasn't changed, or only a few rows have
+        self.log.info(f"Bamboo sheet: {len(sheet.changed_row_ids)} rows changed, {len(sheet.deleted_row_ids)} removed since the last fetch")
+        self.region_mapper.reset()
         self.ss_employees = self._df_to_empl_obj(sheet.df)
+        self.region_mapper.log_report()
         return self.ss_employees
 
     def _df_to_empl_obj(self, dataframe):
         """Takes a dataframe and turns each row into an employee object.
-        Returns dict of employee objects as email:Employee"""
-        employees = []
-        for _, row in dataframe.iterrows():
-            employee = Employee(
-                first_name = row["preferredName"] if pd.notna(row["preferredName"]) and row["preferredName"] else row["firstName"],
-                last_name = row["lastName"],
-                email = row["emailAsText"].lower(),
-                state = row["location"],
-                region = self._normalize_region(row["location"], row["division"]),
-                marketing_classification = "Dowbuilt Employee",
-                company = str(self.HB_DB_COMPANY_ID)
-            )
-            employees.append(employee)
+        Returns list of Employee objects"""
+        self.bamboo_frame = self._bamboo_frame(dataframe)
+        # columns are in Employee field order, so each tuple maps straight onto the constructor
+        employees = [Employee(*values) for values in self.bamboo_frame.itertuples(index=False, name=None)]
         self.log.info(f"Converted {len(employees)} Bamboo employees")
-        #TODO: delete
-        with open("bamboo.json", "w") as of:
-            json.dump({emp.email:asdict(emp) for emp in employees}, of, indent=2)
+        if self.dump_json:
+            with open("bamboo.json", "w") as of:
+                json.dump({emp.email:emp.to_dict() for emp in employees}, of, indent=2)
         return employees
-    
-    def _normalize_region(self, location:str, division:str) -> str:
-        """Normalize the region from Bamboo data to match the dropdown options in Hubspot"""
-        if "Division 10" in division:
-            division = location
-        if division in self.regions:
-            return division
-        
-        for region, locations in self.regions.items():
-            if division in locations:
-                return region
-        
-        return ""
-     
+
+    def _bamboo_frame(self, dataframe) -> "pd.DataFrame":
+        """Column-wise conversion of the Bamboo export into Employee fields.
+        Returns: DataFrame with one column per Employee field (hub_id excluded)"""
+        preferred = dataframe["preferredName"].astype(object)
+        first_name = preferred.where(preferred.notna() & (preferred != ""), dataframe["firstName"])
+        return pd.DataFrame({
+            "first_name": first_name,
+            "last_name": dataframe["lastName"],
+            "email": normalize_email_series(dataframe["emailAsText"]),
+            "state": dataframe["location"],
+            "region": self.region_mapper.map_series(dataframe["location"], dataframe["division"]),
+            "marketing_classification": "Dowbuilt Employee",
+            "company": str(self.HB_DB_COMPANY_ID),
+        })
+
+    def fetch_log_sheet(self) -> grid:
+        """Fetches the HubSpot log sheet ahead of post_to_ss"""
+        sheet = grid(self.HUBSPOT_SS_ID)
+        sheet.fetch_content()
+        return sheet
+
     def get_hubspot_sheet_data(self):
         """Retrieves the current sheet data for the hubspot Employee sheet for update."""
         sheet = grid(self.HUBSPOT_SS_ID)
@@ -157,8 +405,7 @@ class HubspotEmployeeSync():
 #region ---- Helper methods ----
     def load_config(self, file_path = "configs/config.json"):
         try:
-            with open(file_path, "r") as inf:
-                return json.load(inf)
+            return load_config(file_path) #parsed once per process, shared read-only
         except Exception as e:
             self.log.error(f"ERROR: loading config file {e}")
 
@@ -167,6 +414,42 @@ class HubspotEmployeeSync():
         Returns: dict as {email:Employee}"""
         return {emp.email:emp for emp in employees}
     
+    def compact_log_sheet(self, sheet:grid, row_ids:dict):
+        """Archives log sheet history so the sheet (and every fetch of it) stays about one row per employee.
+        Keeps the latest row per email and the last `log_keep_metadata_rows` "Execution Metadata:" rows.
+        With `log_retention_days` set, "Deleted" rows whose Latest Update is older than that are archived as well.
+        Rows are moved to the `log_archive_ss_id` sheet if set, else appended to `log_archive_path`.
+        Params:
+            sheet: fetched log sheet grid
+            row_ids: {lowercased Email: row id} index of the sheet, archived rows are removed from it
+        Returns: number of rows archived"""
+        df = sheet.df
+        emails = df["Email"].astype(object).str.lower()
+        is_meta = (emails == "execution metadata:").to_numpy()
+        latest = df["id"].isin(list(row_ids.values())).to_numpy()
+        archive = emails.notna().to_numpy() & ~is_meta & ~latest # older rows for an email that has a newer one
+
+        meta_ids = df.loc[is_meta, "id"]
+        old_meta = meta_ids.iloc[:max(len(meta_ids) - self.log_keep_metadata_rows, 0)]
+        archive |= df["id"].isin(old_meta).to_numpy()
+
+        if self.log_retention_days is not None and "Removed" in df and "Latest Update" in df:
+            removed = df["Removed"].astype(object).isin([True, "True", "true"]).to_numpy()
+            updated = pd.to_datetime(df["Latest Update"].astype(object), errors="coerce")
+            expired = (updated < datetime.now() - timedelta(days=self.log_retention_days)).to_numpy()
+            archive |= removed & expired & ~is_meta
+
+        stale_ids = df.loc[archive, "id"].tolist()
+        if not stale_ids:
+            return 0
+        self.log.info(f"Archiving {len(stale_ids)} of {len(df)} log sheet rows")
+        archived = set(sheet.archive_rows(stale_ids, archive_id=self.log_archive_ss_id, archive_path=self.log_archive_path))
+        for email in [email for email, row_id in row_ids.items() if row_id in archived]:
+            del row_ids[email]
+        if len(archived) < len(stale_ids):
+            self.log.warning(f"{len(stale_ids) - len(archived)} log sheet rows could not be archived")
+        return len(archived)
+
     def build_row(self, employee:Employee, action:str, update_time:datetime, removed=False):
         """build row to post to SS
         Params:
@@ -183,25 +466,59 @@ class HubspotEmployeeSync():
             "Removed": removed,
         }
     
-    def _get_counts(self):
-        """Gets employee count from both sources"""
-        hub = self.hub_client.get_employees()
-        return len(hub), len(self.ss_employees)
-    
     def execution_metadata(self):
         """Generates metadata about current execution and formats to Employee object for posting to SS"""
-        hub, bb = self._get_counts()
         return {
             "Email": "Execution Metadata:",
             "Latest Update": datetime.now().strftime("%Y-%m-%d %H:%M"),
-            "Comments": f"{hub} hubspot employees synced from {bb} Bamboo employees",
+            "Comments": self.metrics.summary(), #counts come from this run's data, no extra HubSpot search
         }
     
  #endregion
 
+def profile_sync(hbs:HubspotEmployeeSync, directory:str):
+    """Runs hbs.sync() under cProfile and tracemalloc and writes into directory:
+    hub_sync.prof (cProfile stats for pstats/snakeviz), hub_sync_profile.txt (top functions by cumulative time)
+    and hub_sync_memory.txt (peak traced memory and the top allocation sites)"""
+    os.makedirs(directory, exist_ok=True)
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    try:
+        profiler.runcall(hbs.sync)
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        profiler.dump_stats(os.path.join(directory, "hub_sync.prof"))
+        with open(os.path.join(directory, "hub_sync_profile.txt"), "w") as of:
+            pstats.Stats(profiler, stream=of).sort_stats("cumulative").print_stats(40)
+        with open(os.path.join(directory, "hub_sync_memory.txt"), "w") as of:
+            of.write(f"peak {peak / 2**20:.1f} MiB, still allocated at the end {current / 2**20:.1f} MiB\n\n")
+            for stat in snapshot.statistics("lineno")[:30]:
+                of.write(f"{stat}\n")
+        hbs.log.info(f"Profile written to {directory}")
+
 def main():
+    parser = argparse.ArgumentParser(description="Syncs Bamboo employees (from Smartsheet) to HubSpot contacts")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--profile", action="store_true", help="run under cProfile/tracemalloc, the profile is written next to the metrics report")
+    mode.add_argument("--watch", action="store_true", help="keep running and sync whenever the Bamboo sheet changes")
+    parser.add_argument("--interval", type=float, help="with --watch, seconds between Bamboo sheet version polls (watch_interval_seconds)")
+    parser.add_argument("--debounce", type=float, help="with --watch, seconds a change has to settle before syncing (watch_debounce_seconds)")
+    args = parser.parse_args()
     hbs = HubspotEmployeeSync()
-    hbs.sync()
-main()
+    if args.watch:
+        stop = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: stop.set())
+        hbs.watch(args.interval, args.debounce, stop)
+    elif args.profile:
+        hbs.metrics_report_dir = hbs.metrics_report_dir or "reports"
+        profile_sync(hbs, hbs.metrics_report_dir)
+    else:
+        hbs.sync()
+
+if __name__ == "__main__":
+    main()
 
 